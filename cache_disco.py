@@ -0,0 +1,159 @@
+"""
+cache_disco.py
+---------------
+Cache em disco endereçado por conteúdo, compartilhado entre jobs (e entre containers no mesmo volume).
+
+Características:
+1. Chave = SHA-256 de tudo que determina o resultado (hash do arquivo, extrator, versão, config...)
+2. Cada entrada é um JSON em <diretorio>/<chave[:2]>/<chave>.json, gravado de forma atômica
+3. Limite de tamanho com despejo LRU (o mtime do arquivo marca o último acesso)
+4. TTL opcional; entradas expiradas podem ser lidas explicitamente (stale-while-revalidate)
+5. Contadores de hit/miss/gravação/despejo por instância
+
+Estrutura da entrada:
+{
+  "chave": "9b1c4...",
+  "criado_em": 1730727175.2,
+  "valor": {...}
+}
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from log_service import get_logger, safe_mkdir
+
+LOGGER = get_logger("cache_disco")
+
+
+def calcular_chave(*partes: Any) -> str:
+    """SHA-256 estável das partes (serializadas em JSON ordenado)."""
+    bruto = json.dumps(partes, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CacheDisco:
+    """Cache chave→JSON em disco com LRU por tamanho e TTL opcional."""
+
+    def __init__(self, nome: str, diretorio: str | Path, max_bytes: int, ttl_segundos: Optional[float] = None):
+        self.nome = nome
+        self.diretorio = safe_mkdir(diretorio)
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._lock = threading.Lock()
+        self._bytes_estimados: Optional[int] = None
+        self._stats = {"hits": 0, "misses": 0, "expirados": 0, "gravacoes": 0, "despejos": 0}
+
+    # ----------------------------------------------------------------------------
+    # Leitura / escrita
+    # ----------------------------------------------------------------------------
+    def _path(self, chave: str) -> Path:
+        return self.diretorio / chave[:2] / f"{chave}.json"
+
+    def _contar(self, campo: str) -> None:
+        with self._lock:
+            self._stats[campo] += 1
+
+    def obter(self, chave: str, permitir_expirado: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Retorna {"valor", "criado_em", "idade_segundos", "expirado"} ou None (miss).
+        Entradas além do TTL só são devolvidas com permitir_expirado=True.
+        """
+        path = self._path(chave)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                registro = json.load(f)
+        except FileNotFoundError:
+            self._contar("misses")
+            return None
+        except Exception as e:
+            LOGGER.warning(f"[CACHE:{self.nome}] Entrada ilegível descartada ({path.name}): {e}")
+            path.unlink(missing_ok=True)
+            self._contar("misses")
+            return None
+
+        idade = max(0.0, time.time() - float(registro.get("criado_em", 0)))
+        expirado = self.ttl_segundos is not None and idade > self.ttl_segundos
+        if expirado and not permitir_expirado:
+            self._contar("expirados")
+            return None
+
+        try:
+            os.utime(path)  # marca acesso para o LRU
+        except OSError:
+            pass
+        self._contar("hits")
+        return {
+            "valor": registro.get("valor"),
+            "criado_em": registro.get("criado_em"),
+            "idade_segundos": round(idade, 3),
+            "expirado": expirado,
+        }
+
+    def gravar(self, chave: str, valor: Any) -> None:
+        """Grava a entrada (tmp + os.replace) e aplica o limite de tamanho."""
+        path = self._path(chave)
+        safe_mkdir(path.parent)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        registro = {"chave": chave, "criado_em": time.time(), "valor": valor}
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(registro, f, ensure_ascii=False, default=str)
+            tamanho = tmp.stat().st_size
+            os.replace(tmp, path)
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            LOGGER.warning(f"[CACHE:{self.nome}] Falha ao gravar entrada: {e}")
+            return
+        self._contar("gravacoes")
+        with self._lock:
+            if self._bytes_estimados is not None:
+                self._bytes_estimados += tamanho
+        self._aplicar_limite()
+
+    def invalidar(self, chave: str) -> None:
+        self._path(chave).unlink(missing_ok=True)
+
+    # ----------------------------------------------------------------------------
+    # LRU
+    # ----------------------------------------------------------------------------
+    def _listar_entradas(self):
+        for p in self.diretorio.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            yield p, st.st_size, st.st_mtime
+
+    def _aplicar_limite(self) -> None:
+        with self._lock:
+            if self._bytes_estimados is None:
+                self._bytes_estimados = sum(tam for _, tam, _ in self._listar_entradas())
+            if self._bytes_estimados <= self.max_bytes:
+                return
+            # Remove as entradas menos recentemente usadas até 90% do limite
+            entradas = sorted(self._listar_entradas(), key=lambda e: e[2])
+            total = sum(tam for _, tam, _ in entradas)
+            alvo = int(self.max_bytes * 0.9)
+            for path, tam, _ in entradas:
+                if total <= alvo:
+                    break
+                path.unlink(missing_ok=True)
+                total -= tam
+                self._stats["despejos"] += 1
+            self._bytes_estimados = total
+        LOGGER.info(f"[CACHE:{self.nome}] Limite atingido — despejo LRU concluído ({total} bytes).")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["bytes_estimados"] = self._bytes_estimados
+        consultas = stats["hits"] + stats["misses"] + stats["expirados"]
+        stats["taxa_hit"] = round(stats["hits"] / consultas, 4) if consultas else 0.0
+        return stats
@@ -0,0 +1,145 @@
+"""
+checkpoint.py
+--------------
+Checkpoints por etapa do pipeline LICITANET + OCR + OPENAI (v3).
+
+Objetivo:
+1. Persistir o resultado de cada etapa concluída (OCR, IA1, IA2)
+2. Permitir retomar jobs órfãos em /processing após um restart do container,
+   sem refazer OCR nem pagar novamente pelas chamadas OpenAI
+3. Garantir que a saída reaproveitada corresponde à mesma entrada (fingerprint)
+
+Estrutura (outbox/<job_id>/checkpoints/<etapa>.json):
+{
+  "job_id": "job_001",
+  "etapa": "OCR",
+  "fingerprint": "9b1c4...",
+  "timestamp": "2025-11-04T10:32:55",
+  "saida": {...}
+}
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from log_service import get_logger, init_folders, safe_mkdir
+
+LOGGER = get_logger("checkpoint")
+DIRS = init_folders()
+
+# Arquivos gerados pelo próprio pipeline dentro da pasta do job (não fazem parte da entrada)
+_IGNORAR_NO_FINGERPRINT = {"manifest.normalizado.json"}
+
+
+# =====================================================
+# 🔹 Fingerprints
+# =====================================================
+
+def hash_arquivo(path: str | Path) -> str:
+    """SHA-256 do conteúdo de um arquivo (leitura em blocos)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def calcular_fingerprint(*partes: Any) -> str:
+    """SHA-256 estável de qualquer combinação de valores serializáveis em JSON."""
+    bruto = json.dumps(partes, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def fingerprint_entrada_job(job_dir: str | Path) -> str:
+    """
+    Fingerprint da entrada do job: manifest.json + conteúdo de todos os arquivos enviados.
+    Qualquer alteração em um PDF ou no manifest invalida os checkpoints do job.
+    """
+    job_dir = Path(job_dir)
+    itens = []
+    for p in sorted(job_dir.rglob("*")):
+        if p.is_file() and p.name not in _IGNORAR_NO_FINGERPRINT:
+            itens.append((p.relative_to(job_dir).as_posix(), hash_arquivo(p)))
+    return calcular_fingerprint(itens)
+
+
+# =====================================================
+# 🔹 Persistência
+# =====================================================
+
+def _checkpoint_dir(job_id: str) -> Path:
+    return Path(DIRS["OUTBOX_DIR"]) / job_id / "checkpoints"
+
+
+def salvar_checkpoint(job_id: str, etapa: str, fingerprint: str, saida: Dict[str, Any]) -> Path:
+    """
+    Grava o checkpoint da etapa de forma atômica (arquivo temporário + os.replace),
+    para que um crash no meio da escrita nunca deixe um checkpoint truncado.
+    """
+    ck_dir = safe_mkdir(_checkpoint_dir(job_id))
+    destino = ck_dir / f"{etapa}.json"
+    tmp = ck_dir / f".{etapa}.json.tmp"
+    registro = {
+        "job_id": job_id,
+        "etapa": etapa,
+        "fingerprint": fingerprint,
+        "timestamp": datetime.now().isoformat(),
+        "saida": saida,
+    }
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(registro, f, ensure_ascii=False, indent=2, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, destino)
+    LOGGER.info(f"[{job_id}] Checkpoint salvo: {etapa}")
+    return destino
+
+
+def carregar_checkpoint(job_id: str, etapa: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    Retorna a saída salva da etapa se existir checkpoint com o mesmo fingerprint.
+    Checkpoints ausentes, corrompidos ou de outra entrada retornam None.
+    """
+    path = _checkpoint_dir(job_id) / f"{etapa}.json"
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            registro = json.load(f)
+    except Exception as e:
+        LOGGER.warning(f"[{job_id}] Checkpoint ilegível ({etapa}): {e}")
+        return None
+    if registro.get("fingerprint") != fingerprint:
+        LOGGER.info(f"[{job_id}] Checkpoint de {etapa} ignorado — entrada mudou.")
+        return None
+    LOGGER.info(f"[{job_id}] Checkpoint reaproveitado: {etapa} ({registro.get('timestamp')})")
+    return registro.get("saida")
+
+
+def limpar_checkpoints(job_id: str, etapas: Optional[Iterable[str]] = None) -> None:
+    """Remove os checkpoints do job — todos, ou apenas as etapas informadas."""
+    ck_dir = _checkpoint_dir(job_id)
+    if not ck_dir.exists():
+        return
+    if etapas is None:
+        shutil.rmtree(ck_dir, ignore_errors=True)
+        return
+    for etapa in etapas:
+        (ck_dir / f"{etapa}.json").unlink(missing_ok=True)
+
+
+# =====================================================
+# 🔹 Recuperação
+# =====================================================
+
+def listar_jobs_orfaos() -> Iterable[Path]:
+    """Pastas em /processing com manifest.json — jobs interrompidos antes de irem para done/error."""
+    processing_root = Path(DIRS["PROCESSING_DIR"])
+    if not processing_root.exists():
+        return []
+    return [p for p in sorted(processing_root.iterdir()) if p.is_dir() and (p / "manifest.json").exists()]
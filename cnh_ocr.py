@@ -9,10 +9,10 @@ import pytesseract
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-from pdf2image import convert_from_path
 from PIL import Image
 from typing import Dict, Any, List, Optional
 from log_service import get_logger, init_folders, safe_mkdir
+from rasterizador import iterar_paginas
 import ledger
 
 # Tenta importar pyzbar para QR Code
@@ -57,46 +57,22 @@ def process_cnh(
     # Pela lógica do ledger atual, should_reprocess pede hash_md também (o que implica ter o resultado anterior).
     # Vamos seguir o fluxo de processar primeiro para garantir os dados.
     
-    # 2. Conversão para Imagens
-    try:
-        images = convert_from_path(path_pdf, dpi=300)
-    except Exception as e:
-        LOGGER.exception(f"Erro ao converter PDF {path_pdf}: {e}")
-        return {"error": str(e), "status": "ERRO"}
-
+    # 2. Conversão para Imagens (streaming: uma janela pequena de páginas por vez)
     evid_dir = Path(DIRS["EVID_OCR_DIR"]) / job_id
     safe_mkdir(evid_dir)
     
     extracted_text_pages = []
     extracted_data_pages = []
     
-    for i, img in enumerate(images):
-        page_num = i + 1
-        LOGGER.info(f"Processando página {page_num} de {path_pdf}")
-        
-        # Pré-processamento OpenCV
-        img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        
-        # Salva ROI original para debug
-        # cv2.imwrite(str(evid_dir / f"{arquivo_id}_p{page_num}_orig.png"), img_cv)
-
-        # Pipeline de Extração
-        ocr_result = _extract_page_content(img_cv)
-        
-        # Consolida Texto
-        page_md = f"### Página {page_num}\n\n{ocr_result['text']}\n"
-        if ocr_result.get('mrz'):
-            page_md += f"\n**MRZ Detectado:**\n`{ocr_result['mrz']}`\n"
-        
-        extracted_text_pages.append(page_md)
-        extracted_data_pages.append(ocr_result['data'])
-        
-        # Tenta ler QR Code se disponível
-        if PYZBAR_AVAILABLE:
-            qr_data = _read_qr_code(img_cv)
-            if qr_data:
-                page_md += f"\n**QR Code:** {qr_data}\n"
-                ocr_result['data']['qr_code'] = qr_data
+    try:
+        paginas = iterar_paginas(path_pdf, dpi=300)
+        for page_num, img in paginas:
+            LOGGER.info(f"Processando página {page_num} de {path_pdf}")
+            _processar_pagina_cnh(img, page_num, extracted_text_pages, extracted_data_pages)
+            del img
+    except Exception as e:
+        LOGGER.exception(f"Erro ao converter PDF {path_pdf}: {e}")
+        return {"error": str(e), "status": "ERRO"}
                 
     # 3. Consolidação Final
     full_markdown = "\n---\n".join(extracted_text_pages)
@@ -151,6 +127,33 @@ def process_cnh(
     }
 
 
+def _processar_pagina_cnh(img: Image.Image, page_num: int, text_pages: List[str], data_pages: List[Dict[str, Any]]) -> None:
+    """Extrai texto/MRZ/QR de uma página e acumula nos resultados do documento."""
+    # Pré-processamento OpenCV
+    img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    
+    # Salva ROI original para debug
+    # cv2.imwrite(str(evid_dir / f"{arquivo_id}_p{page_num}_orig.png"), img_cv)
+
+    # Pipeline de Extração
+    ocr_result = _extract_page_content(img_cv)
+    
+    # Consolida Texto
+    page_md = f"### Página {page_num}\n\n{ocr_result['text']}\n"
+    if ocr_result.get('mrz'):
+        page_md += f"\n**MRZ Detectado:**\n`{ocr_result['mrz']}`\n"
+    
+    text_pages.append(page_md)
+    data_pages.append(ocr_result['data'])
+    
+    # Tenta ler QR Code se disponível
+    if PYZBAR_AVAILABLE:
+        qr_data = _read_qr_code(img_cv)
+        if qr_data:
+            page_md += f"\n**QR Code:** {qr_data}\n"
+            ocr_result['data']['qr_code'] = qr_data
+
+
 def preprocess_image(img_cv: np.ndarray) -> np.ndarray:
     """Pré-processamento básico para melhorar OCR (User Provided)."""
     gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
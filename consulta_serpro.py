@@ -5,7 +5,10 @@ import os
 import re
 import json
 import time
+import atexit
 import inspect
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Tuple
@@ -13,6 +16,8 @@ from typing import Tuple
 import httpx  # cliente HTTP usado em outras apps suas
 
 from log_service import get_logger, init_folders, safe_mkdir
+from cache_disco import CacheDisco
+from despachante_receitaws import AGENDADOR, RECEITAWS_PRAZO_SEGUNDOS, RECEITAWS_RPM, PrazoExcedido, coalescer, em_voo
 
 LOGGER = get_logger("receitaws_agent")
 DIRS = init_folders()
@@ -26,6 +31,72 @@ RECEITAWS_TOKEN = os.getenv("RECEITAWS_TOKEN", "").strip()
 RECEITAWS_TIMEOUT = float(os.getenv("RECEITAWS_TIMEOUT", "20"))
 RECEITAWS_RETRIES = int(os.getenv("RECEITAWS_RETRIES", "3"))
 RECEITAWS_BACKOFF = float(os.getenv("RECEITAWS_BACKOFF", "1.5"))  # fator exponencial
+RECEITAWS_MAX_PARALELO = int(os.getenv("RECEITAWS_MAX_PARALELO", "4"))  # consultas em segundo plano simultâneas
+
+# Pré-busca do CNPJ assim que o job aparece no /inbox (ver pre_buscar_cnpj_do_manifest)
+RECEITAWS_PREFETCH = os.getenv("RECEITAWS_PREFETCH", "true").strip().lower() in ("1", "true", "sim", "yes")
+RECEITAWS_PREFETCH_INTERVALO = float(os.getenv("RECEITAWS_PREFETCH_INTERVALO", "300"))  # s entre pré-buscas do mesmo CNPJ
+RECEITAWS_PREFETCH_PARALELO = max(1, int(os.getenv("RECEITAWS_PREFETCH_PARALELO", "1")))  # pré-buscas simultâneas (pool próprio)
+
+# Pool de conexões HTTP compartilhado (keep-alive: consultas seguintes reaproveitam a conexão TLS)
+RECEITAWS_CONNECT_TIMEOUT = float(os.getenv("RECEITAWS_CONNECT_TIMEOUT", "5"))
+RECEITAWS_MAX_CONEXOES = int(os.getenv("RECEITAWS_MAX_CONEXOES", "10"))
+RECEITAWS_MAX_KEEPALIVE = int(os.getenv("RECEITAWS_MAX_KEEPALIVE", "5"))
+RECEITAWS_KEEPALIVE_SEGUNDOS = float(os.getenv("RECEITAWS_KEEPALIVE_SEGUNDOS", "60"))
+
+# Pool para consultas disparadas em paralelo ao OCR/IA1 (ver consultar_cnpj_em_segundo_plano)
+_EXECUTOR_CONSULTAS = ThreadPoolExecutor(max_workers=RECEITAWS_MAX_PARALELO, thread_name_prefix="receitaws")
+# Pool separado e pequeno para as pré-buscas especulativas: nunca ocupam vaga das consultas dos jobs
+_EXECUTOR_PREFETCH = ThreadPoolExecutor(max_workers=RECEITAWS_PREFETCH_PARALELO, thread_name_prefix="receitaws-prefetch")
+
+# Cache persistente das respostas por CNPJ; entradas vencidas ainda servem se a API estiver falhando
+RECEITAWS_CACHE_ATIVO = os.getenv("RECEITAWS_CACHE", "true").strip().lower() in ("1", "true", "sim", "yes")
+RECEITAWS_CACHE_TTL_HORAS = float(os.getenv("RECEITAWS_CACHE_TTL_HORAS", "24"))
+RECEITAWS_CACHE_MAX_MB = int(os.getenv("RECEITAWS_CACHE_MAX_MB", "64"))
+RECEITAWS_CACHE = CacheDisco(
+    "receitaws",
+    Path(DIRS["CACHE_DIR"]) / "receitaws",
+    max_bytes=RECEITAWS_CACHE_MAX_MB * 1024 * 1024,
+    ttl_segundos=RECEITAWS_CACHE_TTL_HORAS * 3600,
+)
+
+
+# ===== Cliente HTTP compartilhado =====
+_HTTP_CLIENT: httpx.Client | None = None
+_HTTP_LOCK = threading.Lock()
+
+def _opcoes_http() -> dict:
+    return {
+        "timeout": httpx.Timeout(RECEITAWS_TIMEOUT, connect=RECEITAWS_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=RECEITAWS_MAX_CONEXOES,
+            max_keepalive_connections=RECEITAWS_MAX_KEEPALIVE,
+            keepalive_expiry=RECEITAWS_KEEPALIVE_SEGUNDOS,
+        ),
+        "headers": {"Accept": "application/json"},
+    }
+
+def get_http_client() -> httpx.Client:
+    """Cliente síncrono do processo (thread-safe), compartilhado por todos os jobs."""
+    global _HTTP_CLIENT
+    with _HTTP_LOCK:
+        if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+            _HTTP_CLIENT = httpx.Client(**_opcoes_http())
+        return _HTTP_CLIENT
+
+def set_http_client(client: httpx.Client | None) -> None:
+    """Injeta um cliente (ex.: transporte de teste ou proxy); None volta ao cliente padrão."""
+    global _HTTP_CLIENT
+    with _HTTP_LOCK:
+        _HTTP_CLIENT = client
+
+@atexit.register
+def fechar_clientes_http() -> None:
+    global _HTTP_CLIENT
+    with _HTTP_LOCK:
+        if _HTTP_CLIENT is not None:
+            _HTTP_CLIENT.close()
+            _HTTP_CLIENT = None
 
 
 from typing import Tuple
@@ -101,19 +172,96 @@ def _save_json(path: Path, data: dict):
     with path.open("w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
+def _info_cache(origem: str, em_cache: dict | None = None) -> dict:
+    """Procedência dos dados: RECEITAWS (consulta agora), CACHE (dentro do TTL) ou CACHE_EXPIRADO (API falhando)."""
+    if em_cache is None:
+        return {"origem": origem, "consultado_em": datetime.now().isoformat(timespec="seconds"), "idade_segundos": 0.0}
+    return {
+        "origem": origem,
+        "consultado_em": datetime.fromtimestamp(float(em_cache["criado_em"])).isoformat(timespec="seconds"),
+        "idade_segundos": em_cache["idade_segundos"],
+    }
 
-# ===== Camada ReceitaWS (fonte única) =====
-def _consultar_receitaws(cnpj: str, entrada_path: Path, saida_path: Path) -> dict:
+def _consultar_com_cache(cnpj: str, entrada_path: Path, saida_path: Path) -> dict:
     """
-    Consulta a ReceitaWS com retries e backoff exponencial.
-    Nunca levanta exceção para o pipeline — sempre retorna dict padronizado.
+    Cache na frente da ReceitaWS:
+    - hit dentro do TTL → não consulta a API
+    - miss/expirado → consulta; sucesso atualiza o cache
+    - API com erro → serve a última resposta conhecida (stale), sinalizada como CACHE_EXPIRADO
     """
-    # Monta URL com token opcional (?token=...)
+    if not RECEITAWS_CACHE_ATIVO:
+        res = _consultar_receitaws(cnpj, entrada_path, saida_path)
+        if res.get("status") == "OK":
+            res["cache"] = _info_cache("RECEITAWS")
+        return res
+
+    em_cache = RECEITAWS_CACHE.obter(cnpj)
+    if em_cache:
+        LOGGER.info(f"[RECEITAWS][{cnpj}] Cache hit (idade {em_cache['idade_segundos']:.0f}s) — consulta à API dispensada.")
+        _save_json(saida_path, em_cache["valor"])
+        return {"status": "OK", "dados": em_cache["valor"], "serpro_disponivel": False, "cache": _info_cache("CACHE", em_cache)}
+
+    res = _consultar_receitaws(cnpj, entrada_path, saida_path)
+    if res.get("status") == "OK":
+        RECEITAWS_CACHE.gravar(cnpj, res["dados"])
+        res["cache"] = _info_cache("RECEITAWS")
+        return res
+
+    antigo = RECEITAWS_CACHE.obter(cnpj, permitir_expirado=True)
+    if antigo:
+        LOGGER.warning(
+            f"[RECEITAWS][{cnpj}] API indisponível ({res.get('status')}) — usando resposta em cache "
+            f"de {antigo['idade_segundos'] / 3600:.1f}h atrás."
+        )
+        _save_json(saida_path, antigo["valor"])
+        return {
+            "status": "OK",
+            "dados": antigo["valor"],
+            "serpro_disponivel": False,
+            "cache": {**_info_cache("CACHE_EXPIRADO", antigo), "erro_api": res.get("erro") or res.get("status")},
+        }
+    return res
+
+
+# ===== Camada ReceitaWS (fonte única) =====
+_RE_SEGUNDOS = re.compile(r"(\d+)\s*(?:segundos|seconds|s\b)", re.IGNORECASE)
+_RE_LIMITE = re.compile(r"limite|too many|nova consulta|try again|aguarde", re.IGNORECASE)
+
+def _eh_limite(msg: str) -> bool:
+    """status=ERROR de cota/espera (transitório, vale para todos) vs. erro do próprio CNPJ (definitivo)."""
+    return bool(_RE_SEGUNDOS.search(msg or "") or _RE_LIMITE.search(msg or ""))
+
+def _aguardar_local(segundos: float, prazo: float) -> None:
+    """Backoff só desta consulta (falha de rede/servidor), sem passar do prazo."""
+    time.sleep(max(0.0, min(segundos, prazo - time.monotonic())))
+
+def _espera_sugerida(attempt: int, resp: httpx.Response | None = None, msg: str = "") -> float:
+    """Retry-After (429) ou segundos citados na mensagem de limite; senão backoff exponencial com teto."""
+    if resp is not None:
+        try:
+            return float(resp.headers.get("retry-after", ""))
+        except ValueError:
+            pass
+    m = _RE_SEGUNDOS.search(msg or "")
+    if m:
+        return float(m.group(1))
+    return min(RECEITAWS_BACKOFF ** attempt, 15)
+
+def _montar_url(cnpj: str) -> str:
+    """URL da consulta com token opcional (?token=...)."""
     url = f"{RECEITAWS_BASE_URL}{cnpj}"
     if RECEITAWS_TOKEN:
         sep = "&" if "?" in url else "?"
         url = f"{url}{sep}token={RECEITAWS_TOKEN}"
+    return url
 
+def _consultar_receitaws(cnpj: str, entrada_path: Path, saida_path: Path) -> dict:
+    """
+    Consulta a ReceitaWS pelo despachante compartilhado (rate limit, fila FIFO com prazo e
+    single-flight por CNPJ). Cada chamador grava as próprias evidências de entrada/saída.
+    Nunca levanta exceção para o pipeline — sempre retorna dict padronizado.
+    """
+    url = _montar_url(cnpj)
     entrada = {
         "fonte": "RECEITAWS",
         "cnpj": cnpj,
@@ -121,52 +269,74 @@ def _consultar_receitaws(cnpj: str, entrada_path: Path, saida_path: Path) -> dic
         "timeout": RECEITAWS_TIMEOUT,
         "retries": RECEITAWS_RETRIES,
         "backoff": RECEITAWS_BACKOFF,
+        "rpm": RECEITAWS_RPM,
+        "prazo_segundos": RECEITAWS_PRAZO_SEGUNDOS,
         "tem_token": bool(RECEITAWS_TOKEN),
     }
     _save_json(entrada_path, entrada)
 
+    res, compartilhada = coalescer(cnpj, lambda: _buscar_receitaws(cnpj, url))
+    if compartilhada:
+        res = {**res, "compartilhada": True}
+    if res.get("status") == "OK":
+        _save_json(saida_path, res["dados"])
+    return res
+
+def _buscar_receitaws(cnpj: str, url: str) -> dict:
+    """
+    Tentativas da consulta. Cada requisição aguarda a vez no AGENDADOR; limites da API (429 ou
+    status=ERROR de cota) pausam a fila inteira. Timeouts, erros de conexão e 5xx só atrasam
+    esta consulta; status=ERROR definitivo (ex.: "CNPJ inválido") retorna na hora.
+    """
+    prazo = time.monotonic() + RECEITAWS_PRAZO_SEGUNDOS
     attempt = 0
     while True:
         attempt += 1
         try:
-            with httpx.Client(timeout=RECEITAWS_TIMEOUT) as client:
-                resp = client.get(url)
-                resp.raise_for_status()
-                data = resp.json()
+            AGENDADOR.reservar(prazo)
+            resp = get_http_client().get(url)
+            resp.raise_for_status()
+            data = resp.json()
 
             # ReceitaWS pode devolver {"status": "ERROR", "message": "..."} em casos de limite/espera
             if isinstance(data, dict) and data.get("status") == "ERROR":
                 msg = data.get("message", "Erro ReceitaWS")
                 LOGGER.warning(f"[RECEITAWS][{cnpj}] status=ERROR: {msg}")
                 # Se for erro que pode se resolver sozinho (p.ex. “pode realizar nova consulta em X segundos”),
-                # respeitamos retries. Caso já excedeu retries, retorna erro padronizado.
-                if attempt >= RECEITAWS_RETRIES:
+                # respeitamos retries. Erro do próprio CNPJ ou retries esgotados: erro padronizado.
+                if not _eh_limite(msg) or attempt >= RECEITAWS_RETRIES:
                     return {"status": "ERRO_HTTP", "erro": msg, "dados": {}, "serpro_disponivel": False}
+                AGENDADOR.pausar(_espera_sugerida(attempt, msg=msg), "status=ERROR")
             else:
                 # OK
-                _save_json(saida_path, data)
                 return {"status": "OK", "dados": data, "serpro_disponivel": False}
 
+        except PrazoExcedido as e:
+            LOGGER.warning(f"[RECEITAWS][{cnpj}] Prazo de {RECEITAWS_PRAZO_SEGUNDOS:.0f}s esgotado na fila: {e}")
+            return {"status": "ERRO_TIMEOUT", "erro": f"prazo esgotado na fila ({e})", "dados": {}, "serpro_disponivel": False}
+
         except httpx.TimeoutException as e:
             LOGGER.warning(f"[RECEITAWS][{cnpj}] Timeout (tentativa {attempt}/{RECEITAWS_RETRIES}): {e}")
             if attempt >= RECEITAWS_RETRIES:
                 return {"status": "ERRO_TIMEOUT", "erro": str(e), "dados": {}, "serpro_disponivel": False}
+            _aguardar_local(_espera_sugerida(attempt), prazo)
 
         except httpx.HTTPError as e:
-            status = getattr(e.response, "status_code", None)
+            resp = e.response if isinstance(e, httpx.HTTPStatusError) else None  # erros de conexão não têm response
+            status = getattr(resp, "status_code", None)
             LOGGER.warning(f"[RECEITAWS][{cnpj}] HTTP {status} (tentativa {attempt}/{RECEITAWS_RETRIES}): {e}")
             # 4xx (exceto 429) dificilmente resolvem com retry; 5xx/429 podem ser transientes
             if attempt >= RECEITAWS_RETRIES or (status and status < 500 and status != 429):
                 return {"status": "ERRO_HTTP", "erro": f"HTTP {status}", "dados": {}, "serpro_disponivel": False}
+            if status == 429:
+                AGENDADOR.pausar(_espera_sugerida(attempt, resp=resp), "HTTP 429")
+            else:
+                _aguardar_local(_espera_sugerida(attempt, resp=resp), prazo)
 
         except Exception as e:
             LOGGER.exception(f"[RECEITAWS][{cnpj}] Erro inesperado: {e}")
             return {"status": "ERRO", "erro": str(e), "dados": {}, "serpro_disponivel": False}
 
-        # backoff exponencial com teto (para não travar por muito tempo)
-        sleep_s = min(RECEITAWS_BACKOFF ** attempt, 15)
-        time.sleep(sleep_s)
-
 
 # ===== API pública do módulo (usada no pipeline) =====
 def consultar_cnpj(manifest: dict) -> dict:
@@ -188,6 +358,7 @@ def consultar_cnpj(manifest: dict) -> dict:
       "cnpj": "...",
       "dados": {...},                      # sempre dict
       "serpro_disponivel": False,         # mantido por compatibilidade a IA2/prompts
+      "cache": {"origem": "RECEITAWS|CACHE|CACHE_EXPIRADO", "consultado_em": "...", "idade_segundos": 0.0},
       "arquivos_evidencia": {"entrada": "...", "saida": "..."},
       "data_execucao": "..."
     }
@@ -239,7 +410,7 @@ def consultar_cnpj(manifest: dict) -> dict:
         }
 
 
-    res = _consultar_receitaws(cnpj, entrada_path, saida_path)
+    res = _consultar_com_cache(cnpj, entrada_path, saida_path)
 
     retorno = {
         "status": res.get("status", "ERRO"),
@@ -247,6 +418,7 @@ def consultar_cnpj(manifest: dict) -> dict:
         "cnpj": cnpj,
         "dados": res.get("dados", {}) or {},
         "serpro_disponivel": False,  # fixo (compatibilidade)
+        "cache": res.get("cache"),   # procedência/idade dos dados (RECEITAWS, CACHE, CACHE_EXPIRADO)
         "arquivos_evidencia": {},
         "data_execucao": datetime.now().isoformat()
     }
@@ -258,6 +430,99 @@ def consultar_cnpj(manifest: dict) -> dict:
     return retorno
 
 
+def consultar_cnpj_em_segundo_plano(manifest: dict) -> Future:
+    """
+    Dispara consultar_cnpj(manifest) em background e retorna o Future.
+    O pipeline inicia a consulta no começo do job e só chama .result() quando a IA2 precisa dos dados,
+    sobrepondo a latência da ReceitaWS ao OCR e à IA1. Como consultar_cnpj nunca levanta exceção,
+    .result() sempre devolve o dict padronizado.
+    """
+    return _EXECUTOR_CONSULTAS.submit(consultar_cnpj, manifest)
+
+
+# ===== Pré-busca (watcher) =====
+_PREFETCH_ULTIMA: dict = {}  # chave (cnpj ou manifest) → time.monotonic() da última pré-busca agendada
+_PREFETCH_EM_ANDAMENTO: set = set()  # chaves agendadas ou em execução no _EXECUTOR_PREFETCH
+_PREFETCH_LOCK = threading.Lock()
+
+def _reservar_pre_busca(chave: str) -> bool:
+    """
+    Deduplica antes de enfileirar: recusa chaves já em andamento ou pré-buscadas há menos de
+    RECEITAWS_PREFETCH_INTERVALO e, se o pool estiver ocupado, descarta (pré-busca é só um palpite).
+    """
+    agora = time.monotonic()
+    with _PREFETCH_LOCK:
+        if chave in _PREFETCH_EM_ANDAMENTO or agora - _PREFETCH_ULTIMA.get(chave, float("-inf")) < RECEITAWS_PREFETCH_INTERVALO:
+            return False
+        if len(_PREFETCH_EM_ANDAMENTO) >= RECEITAWS_PREFETCH_PARALELO:
+            LOGGER.debug(f"[RECEITAWS] Pré-busca descartada ({chave}) — pool de pré-busca ocupado.")
+            return False
+        _PREFETCH_EM_ANDAMENTO.add(chave)
+        _PREFETCH_ULTIMA[chave] = agora
+        return True
+
+def _liberar_pre_busca(chave: str, repetir: bool = False) -> None:
+    with _PREFETCH_LOCK:
+        _PREFETCH_EM_ANDAMENTO.discard(chave)
+        if repetir:  # ex.: manifest ainda em upload — a próxima varredura pode tentar de novo
+            _PREFETCH_ULTIMA.pop(chave, None)
+
+def _precisa_pre_buscar(cnpj: str) -> bool:
+    """CNPJ sem consulta em voo (pipeline ou outra pré-busca) e sem entrada válida no cache."""
+    return not em_voo(cnpj) and RECEITAWS_CACHE.obter(cnpj) is None
+
+def _pre_buscar(cnpj: str) -> None:
+    try:
+        res, _ = coalescer(cnpj, lambda: _buscar_receitaws(cnpj, _montar_url(cnpj)))
+        if res.get("status") == "OK":
+            RECEITAWS_CACHE.gravar(cnpj, res["dados"])
+            LOGGER.info(f"[RECEITAWS][{cnpj}] Pré-busca concluída — cache aquecido.")
+        else:
+            LOGGER.info(f"[RECEITAWS][{cnpj}] Pré-busca sem sucesso ({res.get('status')}); o pipeline consultará novamente.")
+    finally:
+        _liberar_pre_busca(cnpj)
+
+def _pre_buscar_do_manifest(manifest_path: Path) -> None:
+    chave = str(manifest_path)
+    try:
+        with Path(manifest_path).open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        LOGGER.debug(f"[RECEITAWS] Pré-busca adiada — manifest ilegível ({manifest_path}): {e}")
+        _liberar_pre_busca(chave, repetir=True)
+        return
+    _liberar_pre_busca(chave)
+    cnpj = _get_cnpj_from_manifest(manifest) if isinstance(manifest, dict) else ""
+    if len(cnpj) == 14 and _precisa_pre_buscar(cnpj) and _reservar_pre_busca(cnpj):
+        _pre_buscar(cnpj)
+
+def pre_buscar_cnpj(cnpj: str) -> Future | None:
+    """
+    Aquece o cache da ReceitaWS para o CNPJ no pool de pré-busca. Não enfileira nada se o cache
+    estiver desativado, o CNPJ for inválido, já houver entrada válida, consulta em voo, pré-busca
+    recente ou o pool de pré-busca estiver ocupado.
+    """
+    cnpj = _limpar_cnpj(cnpj)
+    if not (RECEITAWS_PREFETCH and RECEITAWS_CACHE_ATIVO) or len(cnpj) != 14:
+        return None
+    if not _precisa_pre_buscar(cnpj) or not _reservar_pre_busca(cnpj):
+        return None
+    return _EXECUTOR_PREFETCH.submit(_pre_buscar, cnpj)
+
+def pre_buscar_cnpj_do_manifest(manifest_path: Path) -> Future | None:
+    """
+    Agenda a pré-busca do CNPJ do manifest.json bruto (fornecedor_id, contexto.cnpj ou cnpj).
+    A deduplicação por manifest (em andamento / agendado há pouco) acontece antes de enfileirar,
+    então varreduras repetidas durante o upload não acumulam tarefas. A leitura do manifest (sem
+    validação de schema) e a consulta ao cache ficam no pool, fora da thread de detecção.
+    """
+    if not (RECEITAWS_PREFETCH and RECEITAWS_CACHE_ATIVO):
+        return None
+    if not _reservar_pre_busca(str(manifest_path)):
+        return None
+    return _EXECUTOR_PREFETCH.submit(_pre_buscar_do_manifest, Path(manifest_path))
+
+
 # ===== Teste isolado =====
 if __name__ == "__main__":
     manifest_teste = {
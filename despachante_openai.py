@@ -0,0 +1,228 @@
+"""
+despachante_openai.py
+----------------------
+Despachante central e assíncrono de chamadas à OpenAI, compartilhado por todos os jobs do processo.
+
+Características:
+1. Um único event loop asyncio em thread própria executa todas as chamadas (AsyncOpenAI)
+2. Dois token buckets — requisições/minuto (OPENAI_RPM) e tokens/minuto (OPENAI_TPM) — liberam as
+   chamadas no ritmo da cota; o custo em tokens é estimado antes e acertado com o `usage` da resposta
+3. Em 429 o header Retry-After pausa o despachante inteiro (não só a chamada que falhou)
+4. Novas tentativas com backoff exponencial e jitter (429, 5xx, timeout, erro de conexão)
+5. Métricas: profundidade da fila, chamadas em voo, concluídas, falhas, 429 e espera média
+
+Uso síncrono (threads dos jobs):
+    completion = executar_chat(messages, model="gpt-4o", temperature=0.4, max_tokens=4000)
+
+Variáveis de ambiente:
+- OPENAI_RPM / OPENAI_TPM: cota da conta (padrão: 500 req/min, 200000 tokens/min)
+- OPENAI_MAX_CONCORRENCIA: chamadas simultâneas em voo (padrão: 8)
+- MAX_RETRIES_OPENAI: tentativas por chamada (padrão: 3)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import openai
+
+from env_loader import get_async_client
+from log_service import get_logger
+from orcamento_tokens import contar_tokens
+
+LOGGER = get_logger("despachante_openai")
+
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_CONCORRENCIA = max(1, int(os.getenv("OPENAI_MAX_CONCORRENCIA", "8")))
+MAX_RETRIES_OPENAI = max(1, int(os.getenv("MAX_RETRIES_OPENAI", "3")))
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_MAX_SECONDS = 60.0
+
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+# =====================================================
+# 🔹 Rate limiting
+# =====================================================
+
+class _BaldeTokens:
+    """Token bucket com reposição contínua: `capacidade` unidades por minuto."""
+
+    def __init__(self, capacidade_por_minuto: int):
+        self.capacidade = float(max(1, capacidade_por_minuto))
+        self.taxa = self.capacidade / 60.0
+        self.disponivel = self.capacidade
+        self.atualizado = time.monotonic()
+
+    def _repor(self) -> None:
+        agora = time.monotonic()
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def espera_para(self, n: float) -> float:
+        """Segundos até haver `n` unidades (0 se já houver)."""
+        self._repor()
+        n = min(n, self.capacidade)
+        return 0.0 if self.disponivel >= n else (n - self.disponivel) / self.taxa
+
+    def consumir(self, n: float) -> None:
+        self._repor()
+        self.disponivel -= min(n, self.capacidade)
+
+    def ajustar(self, delta: float) -> None:
+        """Acerta a estimativa com o consumo real (delta > 0 devolve unidades)."""
+        self._repor()
+        self.disponivel = min(self.capacidade, self.disponivel + delta)
+
+
+class _Despachante:
+    def __init__(self):
+        self.rpm = _BaldeTokens(OPENAI_RPM)
+        self.tpm = _BaldeTokens(OPENAI_TPM)
+        self.lock = asyncio.Lock()
+        self.concorrencia = asyncio.Semaphore(OPENAI_MAX_CONCORRENCIA)
+        self.pausa_ate = 0.0  # monotonic; definido por Retry-After de um 429
+        self.stats = {"fila": 0, "em_voo": 0, "concluidas": 0, "falhas": 0, "retries": 0, "respostas_429": 0, "espera_total_s": 0.0}
+
+    async def _reservar(self, tokens: int) -> None:
+        """Aguarda a vez na cota (FIFO pelo lock) e consome 1 requisição + `tokens` estimados."""
+        async with self.lock:
+            while True:
+                espera = max(
+                    self.pausa_ate - time.monotonic(),
+                    self.rpm.espera_para(1),
+                    self.tpm.espera_para(tokens),
+                )
+                if espera <= 0:
+                    break
+                await asyncio.sleep(espera)
+            self.rpm.consumir(1)
+            self.tpm.consumir(tokens)
+
+    async def chat(self, tentativas: int, **kwargs) -> Any:
+        estimados = _estimar_tokens(kwargs.get("messages", []), kwargs.get("model", ""), kwargs.get("max_tokens"))
+        self.stats["fila"] += 1
+        if self.stats["fila"] > OPENAI_MAX_CONCORRENCIA:
+            LOGGER.info(f"Fila do despachante OpenAI: {self.stats['fila']} chamada(s) aguardando cota.")
+        inicio = time.monotonic()
+        enfileirado = True
+        try:
+            for tentativa in range(1, tentativas + 1):
+                await self._reservar(estimados)
+                async with self.concorrencia:
+                    if enfileirado:
+                        self.stats["fila"] -= 1
+                        self.stats["espera_total_s"] += time.monotonic() - inicio
+                        enfileirado = False
+                    self.stats["em_voo"] += 1
+                    try:
+                        resposta = await get_async_client().chat.completions.create(**kwargs)
+                    except Exception as e:
+                        espera = self._tratar_erro(e, tentativa, tentativas)
+                        if espera is None:
+                            self.stats["falhas"] += 1
+                            raise
+                        self.stats["retries"] += 1
+                    else:
+                        usados = getattr(getattr(resposta, "usage", None), "total_tokens", None)
+                        if usados is not None:
+                            self.tpm.ajustar(estimados - usados)
+                        self.stats["concluidas"] += 1
+                        return resposta
+                    finally:
+                        self.stats["em_voo"] -= 1
+                LOGGER.warning(f"Chamada OpenAI falhou (tentativa {tentativa}/{tentativas}) — nova tentativa em {espera:.1f}s.")
+                await asyncio.sleep(espera)
+        finally:
+            if enfileirado:
+                self.stats["fila"] -= 1
+
+    def _tratar_erro(self, erro: Exception, tentativa: int, tentativas: int) -> Optional[float]:
+        """Retorna a espera antes da próxima tentativa, ou None se o erro não deve ser repetido."""
+        status = getattr(erro, "status_code", None)
+        if status == 429:
+            self.stats["respostas_429"] += 1
+        repetivel = isinstance(erro, (openai.APIConnectionError, openai.APITimeoutError)) or status in (408, 409, 429) or (status or 0) >= 500
+        if not repetivel or tentativa >= tentativas:
+            return None
+        backoff = random.uniform(0, min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * 2 ** tentativa))  # full jitter
+        retry_after = _retry_after(erro)
+        if status == 429 and retry_after is not None:
+            # Cota estourada para todos: pausa o despachante inteiro
+            self.pausa_ate = max(self.pausa_ate, time.monotonic() + retry_after)
+            return retry_after + random.uniform(0, 1)
+        return max(backoff, retry_after or 0.0)
+
+
+def _estimar_tokens(messages: List[Dict[str, Any]], model: str, max_tokens: Optional[int]) -> int:
+    texto = "".join(str(m.get("content", "")) for m in messages)
+    return contar_tokens(texto, model or "gpt-4o") + 4 * len(messages) + (max_tokens or 0)
+
+
+def _retry_after(erro: Exception) -> Optional[float]:
+    headers = getattr(getattr(erro, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+# =====================================================
+# 🔹 Event loop em background
+# =====================================================
+
+_DESPACHANTE: Optional[_Despachante] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP, _DESPACHANTE
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="openai-despachante", daemon=True).start()
+            _DESPACHANTE = asyncio.run_coroutine_threadsafe(_criar_despachante(), _LOOP).result()
+            LOGGER.info(f"Despachante OpenAI iniciado (RPM={OPENAI_RPM}, TPM={OPENAI_TPM}, concorrência={OPENAI_MAX_CONCORRENCIA}).")
+        return _LOOP
+
+
+async def _criar_despachante() -> _Despachante:
+    return _Despachante()
+
+
+# =====================================================
+# 🔹 API pública
+# =====================================================
+
+async def chat_async(tentativas: int = MAX_RETRIES_OPENAI, **kwargs) -> Any:
+    """Versão assíncrona (deve rodar no loop do despachante — ver executar_chat)."""
+    return await _DESPACHANTE.chat(tentativas, **kwargs)
+
+
+def executar_chat(messages: List[Dict[str, Any]], model: str, tentativas: int = MAX_RETRIES_OPENAI, **kwargs) -> Any:
+    """
+    Envia chat.completions.create pelo despachante e bloqueia até a resposta.
+    Seguro para chamar de qualquer thread (jobs em paralelo compartilham a mesma cota).
+    """
+    loop = _get_loop()
+    futuro = asyncio.run_coroutine_threadsafe(chat_async(tentativas, messages=messages, model=model, **kwargs), loop)
+    return futuro.result()
+
+
+def metricas() -> Dict[str, Any]:
+    """Fila, chamadas em voo e contadores do despachante."""
+    if _DESPACHANTE is None:
+        return {}
+    stats = dict(_DESPACHANTE.stats)
+    iniciadas = stats["concluidas"] + stats["falhas"] + stats["em_voo"]
+    stats["espera_media_s"] = round(stats.pop("espera_total_s") / iniciadas, 3) if iniciadas else 0.0
+    stats["pausado_s"] = round(max(0.0, _DESPACHANTE.pausa_ate - time.monotonic()), 3)
+    return stats
@@ -0,0 +1,171 @@
+"""
+despachante_receitaws.py
+-------------------------
+Agendador compartilhado das consultas à ReceitaWS (todas as threads/jobs do processo).
+
+Características:
+1. Token bucket no ritmo do plano contratado (RECEITAWS_RPM consultas/minuto, rajada RECEITAWS_RAJADA)
+2. Fila FIFO: as consultas são liberadas na ordem de chegada; cada uma tem um prazo e, se a vez
+   não chegar a tempo, desiste com PrazoExcedido (o chamador cai no cache expirado, se houver)
+3. Pausa global: um 429 / "status: ERROR" de cota da API suspende a fila inteira pelo tempo
+   indicado, em vez de cada worker dormir o próprio backoff (falhas de rede e erros do próprio
+   CNPJ não pausam a fila)
+4. Single-flight: jobs simultâneos do mesmo CNPJ aguardam a mesma consulta em voo
+
+Uso:
+    resultado, compartilhada = coalescer(cnpj, lambda: buscar(cnpj))
+    ...dentro de buscar(): AGENDADOR.reservar(prazo) antes de cada requisição HTTP
+
+Variáveis de ambiente:
+- RECEITAWS_RPM: consultas por minuto liberadas (padrão: 3 — plano gratuito)
+- RECEITAWS_RAJADA: consultas que podem sair de imediato após um período ocioso (padrão: 3)
+- RECEITAWS_PRAZO_SEGUNDOS: tempo máximo de uma consulta na fila, somando as tentativas (padrão: 180)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+from log_service import get_logger
+
+LOGGER = get_logger("despachante_receitaws")
+
+RECEITAWS_RPM = max(0.1, float(os.getenv("RECEITAWS_RPM", "3")))
+RECEITAWS_RAJADA = max(1, int(os.getenv("RECEITAWS_RAJADA", "3")))
+RECEITAWS_PRAZO_SEGUNDOS = float(os.getenv("RECEITAWS_PRAZO_SEGUNDOS", "180"))
+
+
+class PrazoExcedido(Exception):
+    """A vez na fila não chegaria antes do prazo da consulta."""
+
+
+# =====================================================
+# 🔹 Rate limiting + fila FIFO
+# =====================================================
+
+class _Agendador:
+    """Token bucket com fila FIFO, prazos por consulta e pausa global."""
+
+    def __init__(self, por_minuto: float, rajada: int):
+        self.capacidade = float(rajada)
+        self.taxa = por_minuto / 60.0
+        self.disponivel = self.capacidade
+        self.atualizado = time.monotonic()
+        self.pausa_ate = 0.0
+        self._cond = threading.Condition()
+        self._fila: deque = deque()
+        self.stats = {"liberadas": 0, "prazos_excedidos": 0, "pausas": 0, "espera_total_s": 0.0}
+
+    def _repor(self, agora: float) -> None:
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def reservar(self, prazo: float) -> None:
+        """
+        Bloqueia até a vez desta consulta (ordem de chegada) e consome 1 ficha.
+        `prazo` é um instante de time.monotonic(); levanta PrazoExcedido se não houver vez a tempo.
+        """
+        ticket = object()
+        inicio = time.monotonic()
+        with self._cond:
+            self._fila.append(ticket)
+            try:
+                while True:
+                    agora = time.monotonic()
+                    if self._fila[0] is ticket:
+                        self._repor(agora)
+                        falta = 0.0 if self.disponivel >= 1 else (1 - self.disponivel) / self.taxa
+                        espera = max(self.pausa_ate - agora, falta)
+                        if espera <= 0:
+                            self.disponivel -= 1
+                            self.stats["liberadas"] += 1
+                            self.stats["espera_total_s"] += agora - inicio
+                            return
+                        if agora + espera > prazo:
+                            raise PrazoExcedido(f"próxima vez em {espera:.0f}s, além do prazo")
+                    else:
+                        espera = prazo - agora  # aguarda a vez (notify) até o prazo
+                        if espera <= 0:
+                            raise PrazoExcedido(f"{len(self._fila) - 1} consulta(s) à frente na fila")
+                    self._cond.wait(espera)
+            except PrazoExcedido:
+                self.stats["prazos_excedidos"] += 1
+                raise
+            finally:
+                self._fila.remove(ticket)
+                self._cond.notify_all()
+
+    def pausar(self, segundos: float, motivo: str = "") -> None:
+        """Suspende a fila inteira (limite da API atingido)."""
+        with self._cond:
+            ate = time.monotonic() + segundos
+            if ate > self.pausa_ate:
+                self.pausa_ate = ate
+                self.stats["pausas"] += 1
+                LOGGER.warning(f"[RECEITAWS] Fila pausada por {segundos:.0f}s{f' ({motivo})' if motivo else ''}.")
+            self._cond.notify_all()
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats["fila"] = len(self._fila)
+            stats["pausado_s"] = round(max(0.0, self.pausa_ate - time.monotonic()), 3)
+        liberadas = stats["liberadas"]
+        stats["espera_media_s"] = round(stats.pop("espera_total_s") / liberadas, 3) if liberadas else 0.0
+        return stats
+
+
+AGENDADOR = _Agendador(RECEITAWS_RPM, RECEITAWS_RAJADA)
+
+
+# =====================================================
+# 🔹 Single-flight por chave
+# =====================================================
+
+_EM_VOO: Dict[str, Future] = {}
+_EM_VOO_LOCK = threading.Lock()
+
+
+def coalescer(chave: str, funcao: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Executa `funcao` uma única vez por chave entre chamadas simultâneas.
+    Retorna (resultado, compartilhada) — compartilhada=True se aproveitou a consulta de outro job.
+    """
+    with _EM_VOO_LOCK:
+        futuro = _EM_VOO.get(chave)
+        lider = futuro is None
+        if lider:
+            futuro = Future()
+            _EM_VOO[chave] = futuro
+    if not lider:
+        LOGGER.info(f"[RECEITAWS][{chave}] Consulta já em andamento — aguardando o resultado compartilhado.")
+        return futuro.result(), True
+
+    try:
+        resultado = funcao()
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    else:
+        futuro.set_result(resultado)
+        return resultado, False
+    finally:
+        with _EM_VOO_LOCK:
+            _EM_VOO.pop(chave, None)
+
+
+def em_voo(chave: str) -> bool:
+    """Há consulta em andamento para a chave (permite descartar trabalho especulativo antes de enfileirar)."""
+    with _EM_VOO_LOCK:
+        return chave in _EM_VOO
+
+
+def metricas() -> Dict[str, Any]:
+    """Fila, pausas e consultas em voo do agendador."""
+    stats = AGENDADOR.metricas()
+    with _EM_VOO_LOCK:
+        stats["em_voo"] = len(_EM_VOO)
+    return stats
@@ -18,11 +18,15 @@ Dependências:
 
 import os
 import json
-from datetime import datetime
+import hashlib
+from datetime import date, datetime
 from pathlib import Path
 from log_service import get_logger, init_folders, safe_mkdir
 from openai import OpenAI
-from env_loader import get_client, get_model
+from env_loader import get_model
+from despachante_openai import executar_chat
+from cache_disco import CacheDisco
+from orcamento_tokens import aplicar_orcamento, orcamento_para
 # Inicializações
 # Inicializações
 LOGGER = get_logger("openai_agent")
@@ -31,54 +35,170 @@ DIRS = init_folders()
 OPENAI_MODEL = get_model("gpt-4o")
 PROMPT_PF_PATH = os.getenv("PROMPT_PF_PATH", "./prompts/prompt_pf_2410.md")
 PROMPT_PJ_PATH = os.getenv("PROMPT_PJ_PATH", "./prompts/prompt_pj_2410.md")
+OPENAI_TEMPERATURE = 0.4
+
+# Cache persistente de respostas (chave = fingerprint_validacao: modelo, prompt, modo, temperatura, payload)
+LLM_CACHE_ATIVO = os.getenv("LLM_CACHE", "true").strip().lower() in ("1", "true", "sim", "yes")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL_HORAS = float(os.getenv("LLM_CACHE_TTL_HORAS", "720"))
+LLM_CACHE = CacheDisco(
+    "llm",
+    Path(DIRS["CACHE_DIR"]) / "llm",
+    max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+    ttl_segundos=LLM_CACHE_TTL_HORAS * 3600 if LLM_CACHE_TTL_HORAS > 0 else None,
+)
+
+
+def _carregar_prompt(manifest: dict, job_id: str = "") -> str:
+    """Lê o prompt base (PF ou PJ) conforme o perfil do manifest."""
+    tipo = manifest.get("perfil_validacao") or manifest.get("tipo") or "PJ"
+    prompt_path = PROMPT_PF_PATH if tipo == "PF" else PROMPT_PJ_PATH
+    try:
+        with open(prompt_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        LOGGER.bind(job_id=job_id, evento="PROMPT", status="ERRO").error(f"Prompt não encontrado em {prompt_path}")
+        return "Valide o documento conforme as regras padrão."
+
+
+def _data_referencia() -> str:
+    """Data de hoje no formato dos documentos (a mesma usada pelas regras determinísticas)."""
+    return date.today().strftime("%d/%m/%Y")
+
+
+def fingerprint_validacao(conteudo, manifest: dict, modo: str = "padrao") -> str:
+    """
+    Fingerprint da chamada de validação: modelo, conteúdo do prompt, modo, temperatura, payload e
+    data de referência (validade de CNH/procuração é julgada contra "hoje": o veredito de ontem
+    não serve hoje). Mesma entrada no mesmo dia ⇒ mesmo fingerprint (checkpoints e cache LLM).
+    """
+    partes = {
+        "modelo": OPENAI_MODEL,
+        "prompt_sha256": hashlib.sha256(_carregar_prompt(manifest).encode("utf-8")).hexdigest(),
+        "modo": modo,
+        "data_referencia": _data_referencia(),
+        "temperatura": OPENAI_TEMPERATURE,
+        "orcamento_tokens": orcamento_para(modo),
+        "perfil": manifest.get("perfil_validacao") or manifest.get("tipo") or "PJ",
+        "subperfil": manifest.get("subperfil_pf"),
+        "conteudo": conteudo if isinstance(conteudo, str) else json.dumps(conteudo, ensure_ascii=False, sort_keys=True),
+    }
+    bruto = json.dumps(partes, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def _ajustar_ao_orcamento(conteudo, modo: str):
+    """
+    Aplica o orçamento de tokens ao texto OCR: o conteúdo inteiro no modo padrão, ou o campo
+    "dados_ocr" no modo comparativo (demais campos seguem intactos). Retorna (conteudo, relatorio).
+    """
+    if modo != "comparativo":
+        if not isinstance(conteudo, str):
+            return conteudo, None
+        return aplicar_orcamento(conteudo, orcamento_para(modo), OPENAI_MODEL)
+
+    dados = conteudo
+    if isinstance(conteudo, str):
+        try:
+            dados = json.loads(conteudo)
+        except Exception:
+            return aplicar_orcamento(conteudo, orcamento_para(modo), OPENAI_MODEL)
+    if not isinstance(dados, dict) or not isinstance(dados.get("dados_ocr"), str):
+        return conteudo, None
+    texto, relatorio = aplicar_orcamento(dados["dados_ocr"], orcamento_para(modo), OPENAI_MODEL)
+    if not relatorio["ajustado"]:
+        return conteudo, relatorio
+    dados = {**dados, "dados_ocr": texto}
+    return (json.dumps(dados, ensure_ascii=False) if isinstance(conteudo, str) else dados), relatorio
+
+
+def _registrar_metrica_cache(evid_dir: Path, job_id: str, modo: str, chave: str, em_cache) -> None:
+    """Acrescenta o resultado da consulta ao cache em outbox/<job_id>/ia/<job_id>_cache_llm.json."""
+    path = evid_dir / f"{job_id}_cache_llm.json"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            metricas = json.load(f)
+    except Exception:
+        metricas = {"consultas": []}
+    metricas["consultas"].append({
+        "modo": modo,
+        "hit": em_cache is not None,
+        "chave": chave,
+        "idade_segundos": em_cache["idade_segundos"] if em_cache else None,
+        "timestamp": datetime.now().isoformat(),
+    })
+    metricas["cache_llm"] = LLM_CACHE.estatisticas()
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(metricas, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        LOGGER.bind(job_id=job_id, etapa="IA").warning(f"Falha ao gravar métricas do cache LLM: {e}")
 
 
-def validar_documentos_openai(job_id: str, conteudo: str, manifest: dict, modo: str = "padrao") -> dict:
+def validar_documentos_openai(job_id: str, conteudo: str, manifest: dict, modo: str = "padrao", usar_cache: bool = True) -> dict:
     """
     Realiza a validação documental via OpenAI.
     modo="padrao" → primeira validação
     modo="comparativo" → validação final comparando dados SERPRO + OCR + IA1
+    usar_cache=False → ignora respostas em cache (reavaliação forçada); a nova resposta é gravada.
     """
     tipo = manifest.get("perfil_validacao") or manifest.get("tipo") or "PJ"
     subperfil = manifest.get("subperfil_pf")
-    
-    prompt_path = PROMPT_PF_PATH if tipo == "PF" else PROMPT_PJ_PATH
-
-    try:
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            prompt_base = f.read()
-    except Exception:
-        LOGGER.bind(job_id=job_id, evento="PROMPT", status="ERRO").error(f"Prompt não encontrado em {prompt_path}")
-        prompt_base = "Valide o documento conforme as regras padrão."
+    prompt_base = _carregar_prompt(manifest, job_id)
 
     # Cria pasta de saída
     evid_dir = Path(DIRS["OUTBOX_DIR"]) / job_id / "ia"
     safe_mkdir(evid_dir)
 
-    # Monta o input final
-    entrada = {
-        "job_id": job_id,
-        "tipo": tipo,
-        "subperfil": subperfil,
-        "modo": modo,
-        "conteudo": conteudo
-    }
-
-    LOGGER.bind(job_id=job_id, etapa="IA", evento="ENVIO").info(f"Enviando análise para OpenAI ({tipo})...")
-
+    conteudo_original = conteudo
     try:
-        client = get_client()  # <- garante key do .env no momento da chamada
-        completion = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": prompt_base},
-                {"role": "user", "content": json.dumps(entrada, ensure_ascii=False)}
-            ],
-            temperature=0.4,
-            max_tokens=4000
-        )
-
-        resposta = completion.choices[0].message.content.strip()
+        # Orçamento de tokens: mede cada documento e compacta/trunca o excedente
+        conteudo, relatorio_orcamento = _ajustar_ao_orcamento(conteudo, modo)
+        if relatorio_orcamento and relatorio_orcamento["ajustado"]:
+            LOGGER.bind(job_id=job_id, etapa="IA", evento="ORCAMENTO").warning(
+                f"Entrada ajustada ao orçamento ({modo}): {relatorio_orcamento['tokens_originais']} → "
+                f"{relatorio_orcamento['tokens_finais']} tokens (limite {relatorio_orcamento['orcamento']})."
+            )
+
+        # Monta o input final
+        entrada = {
+            "job_id": job_id,
+            "tipo": tipo,
+            "subperfil": subperfil,
+            "modo": modo,
+            "data_referencia": _data_referencia(),
+            "conteudo": conteudo
+        }
+
+        # Cache de respostas: mesma entrada (independente do job_id) ⇒ mesma resposta
+        chave_cache = None
+        em_cache = None
+        if LLM_CACHE_ATIVO:
+            chave_cache = fingerprint_validacao(conteudo_original, manifest, modo)
+            em_cache = LLM_CACHE.obter(chave_cache) if usar_cache else None
+            _registrar_metrica_cache(evid_dir, job_id, modo, chave_cache, em_cache)
+
+        if em_cache:
+            LOGGER.bind(job_id=job_id, etapa="IA", evento="CACHE_LLM").info(
+                f"Resposta reaproveitada do cache ({modo}, idade {em_cache['idade_segundos']:.0f}s)."
+            )
+            resposta = em_cache["valor"]["resposta"]
+        else:
+            LOGGER.bind(job_id=job_id, etapa="IA", evento="ENVIO").info(f"Enviando análise para OpenAI ({tipo})...")
+            # Despachante central: cota RPM/TPM compartilhada entre jobs, Retry-After e backoff com jitter
+            completion = executar_chat(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": prompt_base},
+                    {"role": "user", "content": json.dumps(entrada, ensure_ascii=False)}
+                ],
+                temperature=OPENAI_TEMPERATURE,
+                max_tokens=4000
+            )
+
+            resposta = completion.choices[0].message.content.strip()
+            if chave_cache:
+                LLM_CACHE.gravar(chave_cache, {"resposta": resposta, "modelo": OPENAI_MODEL, "modo": modo})
 
         # Tenta converter resposta para JSON estruturado
         try:
@@ -92,7 +212,7 @@ def validar_documentos_openai(job_id: str, conteudo: str, manifest: dict, modo:
         evid_saida = evid_dir / f"{job_id}_saida_{modo}_{ts}.json"
 
         with open(evid_entrada, "w", encoding="utf-8") as f:
-            json.dump(entrada, f, ensure_ascii=False, indent=2)
+            json.dump({**entrada, "orcamento_tokens": relatorio_orcamento}, f, ensure_ascii=False, indent=2)
 
         with open(evid_saida, "w", encoding="utf-8") as f:
             json.dump(resposta_json, f, ensure_ascii=False, indent=2)
@@ -105,6 +225,7 @@ def validar_documentos_openai(job_id: str, conteudo: str, manifest: dict, modo:
             "modo": modo,
             "resultado": resposta_json,
             "resposta_bruta": resposta,
+            "cache": bool(em_cache),
             "data_execucao": datetime.now().isoformat(),
             "arquivos_evidencia": {
                 "entrada": str(evid_entrada),
@@ -0,0 +1,154 @@
+"""
+entrada_comparativa.py
+-----------------------
+Monta a entrada enxuta da IA Validador 2 (modo comparativo).
+
+Em vez de reenviar todo o texto OCR (já analisado pela IA1), a IA2 recebe:
+1. O JSON técnico da IA1 (campos extraídos + trechos de evidência)
+2. Apenas os campos relevantes da ReceitaWS (e a data da consulta, quando vierem do cache)
+3. Os fatos das regras determinísticas
+4. O texto bruto somente dos documentos ligados a critérios que a IA1 marcou INSUFICIENTE
+   (campo "dados_ocr", sujeito ao orçamento de tokens do modo comparativo)
+
+Se o JSON técnico da IA1 não puder ser lido, cai no formato completo (texto OCR inteiro).
+
+Variáveis de ambiente:
+- IA2_ENTRADA_ENXUTA: usa a entrada enxuta (padrão: true)
+- IA2_ANEXAR_TEXTO_INSUFICIENTE: anexa o texto dos documentos com critério INSUFICIENTE (padrão: true)
+"""
+
+import json
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from log_service import get_logger
+from orcamento_tokens import contar_tokens, dividir_documentos
+
+LOGGER = get_logger("entrada_comparativa")
+
+IA2_ENTRADA_ENXUTA = os.getenv("IA2_ENTRADA_ENXUTA", "true").strip().lower() in ("1", "true", "sim", "yes")
+IA2_ANEXAR_TEXTO_INSUFICIENTE = os.getenv("IA2_ANEXAR_TEXTO_INSUFICIENTE", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+# Campos da ReceitaWS usados na comparação (atividades secundárias, billing etc. ficam de fora)
+CAMPOS_RECEITA = (
+    "cnpj", "nome", "fantasia", "situacao", "data_situacao", "motivo_situacao", "situacao_especial",
+    "abertura", "tipo", "porte", "natureza_juridica", "atividade_principal", "capital_social",
+    "logradouro", "numero", "complemento", "bairro", "municipio", "uf", "cep", "qsa",
+)
+
+# Critério do checklist → palavras que identificam o documento correspondente (nome do arquivo / tipo_previsto)
+_DOCUMENTOS_POR_CRITERIO = {
+    "contrato": ("contrato", "estatuto", "ata", "requerimento", "req_ei", "certidao", "certificado"),
+    "documento_ei": ("contrato", "requerimento", "req_ei", "certidao", "certificado"),
+    "cpf_representante": ("cnh", "cpf", "rg", "identidade", "habilitacao", "doc_ident"),
+    "documento_pessoal": ("cnh", "cpf", "rg", "identidade", "habilitacao", "doc_ident", "passaporte"),
+    "comprovante_endereco": ("endereco", "comprovante", "residencia", "conta"),
+    "procuracao": ("procuracao",),
+    "cartao_cnpj": ("cnpj", "cartao"),
+}
+
+_RE_BLOCO_JSON = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+_RE_CABECALHO = re.compile(r"^# (.+) \([^()]+\)$")
+
+
+def _normalizar(texto: str) -> str:
+    return unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii").lower()
+
+
+def extrair_json_tecnico(resultado: Any) -> Optional[Dict[str, Any]]:
+    """JSON técnico da resposta da IA (dict direto ou bloco ```json dentro de resposta_livre)."""
+    if isinstance(resultado, dict) and "checklist" in resultado:
+        return resultado
+    texto = resultado.get("resposta_livre") if isinstance(resultado, dict) else resultado
+    if not isinstance(texto, str):
+        return None
+    candidatos = _RE_BLOCO_JSON.findall(texto)
+    if not candidatos and "{" in texto:
+        candidatos = [texto[texto.index("{"): texto.rindex("}") + 1]]
+    for bruto in reversed(candidatos):
+        try:
+            dados = json.loads(bruto)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(dados, dict) and "checklist" in dados:
+            return dados
+    return None
+
+
+def _criterios_insuficientes(no: Any, caminho: Tuple[str, ...] = ()) -> List[Tuple[str, ...]]:
+    """Caminhos do checklist cujo status é INSUFICIENTE."""
+    achados = []
+    if isinstance(no, dict):
+        if no.get("status") == "INSUFICIENTE":
+            achados.append(caminho)
+        for chave, valor in no.items():
+            if isinstance(valor, dict):
+                achados.extend(_criterios_insuficientes(valor, caminho + (chave,)))
+    return achados
+
+
+def _documentos_para(caminhos: List[Tuple[str, ...]], arquivos: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """{nome_arquivo: [critérios]} para os documentos ligados aos critérios INSUFICIENTES."""
+    selecionados: Dict[str, List[str]] = {}
+    for caminho in caminhos:
+        palavras = next((_DOCUMENTOS_POR_CRITERIO[s] for s in reversed(caminho) if s in _DOCUMENTOS_POR_CRITERIO), ())
+        for arq in arquivos:
+            alvo = _normalizar(f"{arq.get('nome', '')} {arq.get('tipo_previsto', '')}")
+            if any(p in alvo for p in palavras):
+                selecionados.setdefault(arq["nome"], []).append(".".join(caminho))
+    return selecionados
+
+
+def montar_entrada_comparativa(
+    manifest: Dict[str, Any],
+    ocr_result: Dict[str, Any],
+    serpro_result: Dict[str, Any],
+    ia1_result: Dict[str, Any],
+    fatos: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Entrada da IA2: estruturada e enxuta (ou completa, se desativada / IA1 ilegível).
+    A procedência da consulta à ReceitaWS (API x cache, horário) fica fora: varia a cada execução e
+    mudaria o fingerprint da IA2 (cache LLM e checkpoint); ela aparece no relatório final.
+    """
+    dados_ocr = ocr_result.get("dados_extraidos", "")
+    completa = {
+        "dados_ocr": dados_ocr,
+        "dados_serpro": serpro_result.get("dados", {}),
+        "resultado_ia1": ia1_result.get("resultado", {}),
+        "fatos_deterministicos": fatos,
+    }
+    json_ia1 = extrair_json_tecnico(ia1_result.get("resultado", {})) if IA2_ENTRADA_ENXUTA else None
+    if json_ia1 is None:
+        if IA2_ENTRADA_ENXUTA:
+            LOGGER.warning("JSON técnico da IA1 não encontrado — IA2 recebe a entrada completa.")
+        return completa
+
+    dados_receita = serpro_result.get("dados", {}) or {}
+    entrada: Dict[str, Any] = {
+        "resultado_ia1": json_ia1,
+        "dados_serpro": {k: dados_receita[k] for k in CAMPOS_RECEITA if k in dados_receita},
+        "fatos_deterministicos": fatos,
+        "dados_ocr": "",
+        "documentos_anexados": {},
+    }
+
+    if IA2_ANEXAR_TEXTO_INSUFICIENTE:
+        insuficientes = _criterios_insuficientes(json_ia1.get("checklist", {}))
+        arquivos = manifest.get("arquivos", [])
+        anexos = _documentos_para(insuficientes, arquivos)
+        if anexos:
+            partes = []
+            for cabecalho, corpo in dividir_documentos(dados_ocr):
+                m = _RE_CABECALHO.match(cabecalho)
+                if m and m.group(1) in anexos:
+                    partes.append(f"\n\n{cabecalho}{corpo}")
+                    entrada["documentos_anexados"][m.group(1)] = anexos[m.group(1)]
+            entrada["dados_ocr"] = "".join(partes)
+
+    tokens_enxuta = contar_tokens(json.dumps(entrada, ensure_ascii=False))
+    tokens_completa = contar_tokens(json.dumps(completa, ensure_ascii=False))
+    LOGGER.info(f"Entrada IA2 enxuta: {tokens_enxuta} tokens (completa: {tokens_completa}); anexos: {list(entrada['documentos_anexados'])}")
+    return entrada
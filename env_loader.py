@@ -1,7 +1,11 @@
 # env_loader.py
 import os
+import threading
+from typing import Dict
+
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 # Localização do arquivo .env
 DOTENV_PATH = os.path.join(os.path.dirname(__file__), ".env")
@@ -10,14 +14,25 @@ DOTENV_PATH = os.path.join(os.path.dirname(__file__), ".env")
 # Se a variável já existir no Sistema/Docker-compose, ela NÃO será alterada pelo .env.
 load_dotenv(dotenv_path=DOTENV_PATH, override=False)
 
+# Pool de conexões HTTP compartilhado por todos os jobs (keep-alive evita novo handshake TLS por chamada)
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "10"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+
+# Registro de clientes por chave: um único OpenAI (thread-safe) reutilizado pelo processo
+_CLIENTES: Dict[str, OpenAI] = {}
+_CLIENTES_ASYNC: Dict[str, AsyncOpenAI] = {}
+_CLIENTES_LOCK = threading.Lock()
+
 def _mask(s: str, keep: int = 6) -> str:
     if not s or len(s) < keep:
         return "***"
     return s[:keep] + "*" * (len(s) - keep)
 
-def get_client() -> OpenAI:
+def _resolver_api_key() -> str:
     """
-    Retorna um cliente OpenAI respeitando a prioridade:
+    Resolve a chave respeitando a prioridade:
     1. Variáveis de Sistema/Docker
     2. Arquivo .env (fallback)
     """
@@ -35,12 +50,60 @@ def get_client() -> OpenAI:
     if not api_key:
         raise RuntimeError(f"❌ ERRO: OPENAI_API_KEY não encontrada. Verifique seu .env ou Docker-compose em: {DOTENV_PATH}")
 
-    # Cria cliente com a key explícita
-    client = OpenAI(api_key=api_key)
+    return api_key
 
-    # Log de segurança
-    print(f"[OpenAI] Usando chave iniciada em: { _mask(api_key) }")
+def _criar_cliente(api_key: str) -> OpenAI:
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE),
+    )
+    return OpenAI(api_key=api_key, http_client=http_client, timeout=OPENAI_TIMEOUT_SECONDS)
+
+def get_client() -> OpenAI:
+    """
+    Retorna o cliente OpenAI compartilhado do processo (criado na primeira chamada).
+    Seguro para uso concorrente entre jobs; se a chave mudar, um novo cliente é criado.
+    """
+    api_key = _resolver_api_key()
+    with _CLIENTES_LOCK:
+        client = _CLIENTES.get(api_key)
+        if client is None:
+            # Cria cliente com a key explícita
+            client = _criar_cliente(api_key)
+            _CLIENTES[api_key] = client
+            # Log de segurança (uma vez por cliente)
+            print(f"[OpenAI] Usando chave iniciada em: { _mask(api_key) }")
+    return client
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Cliente assíncrono compartilhado (usado pelo despachante_openai, no seu event loop).
+    Sem retries internos: o despachante controla novas tentativas e rate limit.
+    """
+    api_key = _resolver_api_key()
+    with _CLIENTES_LOCK:
+        client = _CLIENTES_ASYNC.get(api_key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE),
+            )
+            client = AsyncOpenAI(api_key=api_key, http_client=http_client, timeout=OPENAI_TIMEOUT_SECONDS, max_retries=0)
+            _CLIENTES_ASYNC[api_key] = client
+            print(f"[OpenAI] Cliente assíncrono usando chave iniciada em: { _mask(api_key) }")
     return client
 
+def reset_client() -> None:
+    """Fecha e descarta os clientes compartilhados (ex.: após rotação de chave)."""
+    with _CLIENTES_LOCK:
+        clientes = list(_CLIENTES.values())
+        _CLIENTES.clear()
+        _CLIENTES_ASYNC.clear()  # fechados pelo coletor; pertencem ao event loop do despachante
+    for client in clientes:
+        try:
+            client.close()
+        except Exception:
+            pass
+
 def get_model(default: str = "gpt-4o") -> str:
     return os.getenv("OPENAI_MODEL", default)
@@ -20,23 +20,41 @@ Dependências:
 
 import os
 import io
+import gc
+import queue
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from log_service import get_logger, init_folders, safe_mkdir
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 # OCR libs
 import pdfplumber
 import pytesseract
-from pdf2image import convert_from_path
 from PIL import Image
+from ocr_tesseract import ocr_paginas_paralelo
 
 # Docling (parser PDF to Markdown)
+from docling.datamodel.base_models import InputFormat
 from docling.document_converter import DocumentConverter
 
 LOGGER = get_logger("ocr_router")
 DIRS = init_folders()
 
+# Pool de DocumentConverter "quentes" (modelos de layout/tabela carregados uma única vez)
+DOCLING_POOL_SIZE = max(1, int(os.getenv("DOCLING_POOL_SIZE", "1")))
+DOCLING_RECYCLE_AFTER = int(os.getenv("DOCLING_RECYCLE_AFTER", "200"))  # 0 = nunca recicla
+DOCLING_PRELOAD = os.getenv("DOCLING_PRELOAD", "false").strip().lower() in ("1", "true", "sim", "yes")
+
+# Pré-classificação por página (camada de texto nativa x imagem)
+OCR_CAMADA_TEXTO = os.getenv("OCR_CAMADA_TEXTO", "true").strip().lower() in ("1", "true", "sim", "yes")
+OCR_MIN_CHARS_PAGINA = int(os.getenv("OCR_MIN_CHARS_PAGINA", "50"))
+
+_CONVERSORES_LIVRES: "queue.Queue[list]" = queue.Queue()
+_CONVERSORES_CRIADOS = 0
+_CONVERSORES_LOCK = threading.Lock()
+
 def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
     """
     Executa OCR/Docling em todos os arquivos listados no manifest.
@@ -112,16 +130,133 @@ def localizar_arquivo(job_id: str, nome_arquivo: str) -> str:
             return str(Path(root) / nome_arquivo)
     return ""
 
+def _criar_conversor() -> list:
+    """
+    Cria um DocumentConverter e já monta o pipeline de PDF (layout/tabelas, modelos baixados pelo
+    preload_models.py) — sem isso o Docling só carrega os modelos no primeiro convert().
+    """
+    LOGGER.bind(evento="DOCLING").info("Inicializando DocumentConverter…")
+    conversor = DocumentConverter()
+    conversor.initialize_pipeline(InputFormat.PDF)
+    return [conversor, 0]  # [conversor, conversões realizadas]
+
+
+@contextmanager
+def _conversor_docling():
+    """
+    Empresta um DocumentConverter do pool. Cada instância é usada por uma thread por vez;
+    com todas ocupadas, a thread aguarda uma ser devolvida. Após DOCLING_RECYCLE_AFTER
+    conversões a instância é descartada (limita crescimento de memória) e recriada sob demanda.
+    """
+    global _CONVERSORES_CRIADOS
+    try:
+        item = _CONVERSORES_LIVRES.get_nowait()
+    except queue.Empty:
+        criar = False
+        with _CONVERSORES_LOCK:
+            if _CONVERSORES_CRIADOS < DOCLING_POOL_SIZE:
+                _CONVERSORES_CRIADOS += 1
+                criar = True
+        if criar:
+            try:
+                item = _criar_conversor()
+            except Exception:
+                with _CONVERSORES_LOCK:
+                    _CONVERSORES_CRIADOS -= 1
+                raise
+        else:
+            item = _CONVERSORES_LIVRES.get()
+
+    try:
+        yield item[0]
+    finally:
+        item[1] += 1
+        if DOCLING_RECYCLE_AFTER and item[1] >= DOCLING_RECYCLE_AFTER:
+            LOGGER.bind(evento="DOCLING").info(f"Reciclando DocumentConverter após {item[1]} conversões.")
+            with _CONVERSORES_LOCK:
+                _CONVERSORES_CRIADOS -= 1
+            del item
+            gc.collect()
+        else:
+            _CONVERSORES_LIVRES.put(item)
+
+
+def aquecer_docling() -> None:
+    """Cria antecipadamente os conversores do pool (startup), evitando a latência no 1º job."""
+    global _CONVERSORES_CRIADOS
+    while True:
+        with _CONVERSORES_LOCK:
+            if _CONVERSORES_CRIADOS >= DOCLING_POOL_SIZE:
+                return
+            _CONVERSORES_CRIADOS += 1
+        try:
+            _CONVERSORES_LIVRES.put(_criar_conversor())
+        except Exception as e:
+            with _CONVERSORES_LOCK:
+                _CONVERSORES_CRIADOS -= 1
+            LOGGER.bind(evento="DOCLING", status="ERRO").warning(f"Falha ao pré-carregar Docling: {e}")
+            return
+
+
 def extrair_com_docling(path_pdf: str) -> str:
     """Tenta converter PDF para texto via Docling."""
     try:
-        converter = DocumentConverter()
-        result = converter.convert(path_pdf)
-        return result.document.export_to_markdown()
+        with _conversor_docling() as converter:
+            result = converter.convert(path_pdf)
+            return result.document.export_to_markdown()
     except Exception as e:
         LOGGER.bind(arquivo=path_pdf, evento="DOCLING", status="ERRO").warning(f"Docling falhou: {e}")
         return ""
 
+def classificar_paginas(path_pdf: str) -> List[Optional[str]]:
+    """
+    Lê a camada de texto nativa de cada página (pdfplumber, sem rasterizar).
+    Retorna, por página, o texto nativo quando ele é útil (>= OCR_MIN_CHARS_PAGINA)
+    ou None quando a página é só imagem e precisa de OCR.
+    """
+    paginas: List[Optional[str]] = []
+    with pdfplumber.open(path_pdf) as pdf:
+        for page in pdf.pages:
+            texto = page.extract_text() or ""
+            paginas.append(texto if len(texto.strip()) >= OCR_MIN_CHARS_PAGINA else None)
+            page.close()  # libera o cache de objetos da página
+    return paginas
+
+
+def extrair_com_camada_texto(path_pdf: str) -> Optional[Tuple[str, str]]:
+    """
+    Roteamento por página: páginas nascidas digitais usam o texto nativo; apenas as páginas
+    só-imagem vão para o OCR Tesseract. O texto é remontado na ordem das páginas.
+
+    Retorna (texto, metodo) com metodo "TextoNativo" ou "Misto", ou None quando a pré-classificação
+    não se aplica (desativada, não-PDF, erro ou nenhuma página com texto) — nesse caso o chamador
+    segue o fluxo Docling/Tesseract completo.
+    """
+    if not OCR_CAMADA_TEXTO or not path_pdf.lower().endswith(".pdf"):
+        return None
+    try:
+        paginas = classificar_paginas(path_pdf)
+    except Exception as e:
+        LOGGER.bind(arquivo=path_pdf, evento="CAMADA_TEXTO", status="ERRO").warning(f"Pré-classificação falhou: {e}")
+        return None
+    if not paginas or all(p is None for p in paginas):
+        return None
+
+    sem_texto = [i for i, p in enumerate(paginas, start=1) if p is None]
+    if sem_texto:
+        LOGGER.bind(arquivo=path_pdf, evento="CAMADA_TEXTO").info(
+            f"{len(paginas) - len(sem_texto)} página(s) com texto nativo; OCR nas páginas {sem_texto}"
+        )
+        for num, texto in zip(sem_texto, ocr_paginas_paralelo(path_pdf, sem_texto)):
+            paginas[num - 1] = texto
+        metodo = "Misto"
+    else:
+        metodo = "TextoNativo"
+
+    texto_final = "".join(f"\n\n--- Página {i} ---\n{texto}" for i, texto in enumerate(paginas, start=1))
+    return texto_final, metodo
+
+
 def extrair_com_tesseract(path_pdf: str) -> str:
     """Converte PDF para imagem e aplica OCR com Tesseract."""
     texto_final = ""
@@ -131,11 +266,9 @@ def extrair_com_tesseract(path_pdf: str) -> str:
             image = Image.open(path_pdf)
             return pytesseract.image_to_string(image, lang="por+eng", config="--psm 6")
 
-        # Se for PDF, converte para imagens
-        images = convert_from_path(path_pdf, dpi=300)
-        for i, img in enumerate(images):
-            texto = pytesseract.image_to_string(img, lang="por+eng", config="--psm 6")
-            texto_final += f"\n\n--- Página {i+1} ---\n{texto}"
+        # Se for PDF, OCR página a página no pool de processos (ordem preservada)
+        for i, texto in enumerate(ocr_paginas_paralelo(path_pdf), start=1):
+            texto_final += f"\n\n--- Página {i} ---\n{texto}"
         return texto_final
     except Exception as e:
         LOGGER.bind(arquivo=path_pdf, evento="TESSERACT", status="ERRO").warning(f"Erro no OCR Tesseract: {e}")
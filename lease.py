@@ -0,0 +1,297 @@
+"""
+lease.py
+---------
+Protocolo de posse (lease) de jobs para vários containers compartilhando o mesmo volume /app/data.
+
+Regras:
+1. Antes de mover/processar um job, o nó cria atomicamente processing/.leases/<job_id>.lease
+   (O_CREAT | O_EXCL). Quem criou o arquivo é o dono do job.
+2. Enquanto processa, o dono renova o heartbeat pelo mesmo protocolo da tomada de posse: renomeia
+   o lease para um nome exclusivo, confirma que ainda é o dono e só então publica o novo conteúdo
+   com os.link (falha se outro nó já criou um lease no lugar) — nunca sobrescreve o lease de outro.
+3. Um lease cujo heartbeat expirou (nó morto) pode ser assumido: o arquivo é renomeado para
+   um "tombstone" exclusivo (apenas um nó consegue o rename) e um novo lease é criado.
+4. Ao terminar (done/error), o dono remove o lease.
+
+Estrutura do lease:
+{
+  "job_id": "job_001",
+  "dono": "host-a:1234:9f2c1e",
+  "adquirido_em": "2025-11-04T10:32:55",
+  "heartbeat": 1730727175.2,
+  "expira_em": 1730727235.2
+}
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+from log_service import get_logger, init_folders, safe_mkdir
+
+LOGGER = get_logger("lease")
+DIRS = init_folders()
+
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "60"))
+LEASE_HEARTBEAT_SECONDS = int(os.getenv("LEASE_HEARTBEAT_SECONDS", str(max(1, LEASE_TTL_SECONDS // 3))))
+
+# Identidade deste processo: NODE_ID (ou hostname) + pid + token de boot
+NODE_ID = os.getenv("NODE_ID", socket.gethostname())
+OWNER_ID = f"{NODE_ID}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_LEASES_DIR = Path(DIRS["PROCESSING_DIR"]) / ".leases"
+safe_mkdir(_LEASES_DIR)
+
+_LEASES_ATIVOS: Set[str] = set()
+_LEASES_LOCK = threading.Lock()
+_HEARTBEAT_THREAD: Optional[threading.Thread] = None
+# Serializa, neste processo, a renovação (que tira o arquivo do lugar por um instante) e as leituras
+# do próprio lease, para que verificar_lease não confunda a renovação em curso com perda de posse
+_ARQUIVO_LOCK = threading.Lock()
+
+
+class LeasePerdido(Exception):
+    """A posse do job passou a outro nó durante o processamento: o pipeline deve parar."""
+
+
+# =====================================================
+# 🔹 Utils internos
+# =====================================================
+
+def _lease_path(job_id: str) -> Path:
+    return _LEASES_DIR / f"{job_id}.lease"
+
+
+def _novo_registro(job_id: str, adquirido_em: Optional[str] = None) -> Dict[str, Any]:
+    agora = time.time()
+    return {
+        "job_id": job_id,
+        "dono": OWNER_ID,
+        "adquirido_em": adquirido_em or datetime.now().isoformat(),
+        "heartbeat": agora,
+        "expira_em": agora + LEASE_TTL_SECONDS,
+    }
+
+
+def _ler(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Arquivo em escrita/corrompido: vale pelo mtime, para não travar o job para sempre
+        try:
+            return {"expira_em": path.stat().st_mtime + LEASE_TTL_SECONDS}
+        except OSError:
+            return None
+
+
+def _expirado(registro: Dict[str, Any]) -> bool:
+    return float(registro.get("expira_em", 0)) < time.time()
+
+
+def _em_renovacao(path: Path) -> bool:
+    """O dono está no meio de uma renovação (arquivo momentaneamente fora do lugar)."""
+    for aparte in path.parent.glob(f"{path.name}.renovando.*"):
+        registro = _ler(aparte)
+        if registro is not None and not _expirado(registro):
+            return True
+        aparte.unlink(missing_ok=True)  # sobra de um nó que morreu no meio da renovação
+    return False
+
+
+def _criar_exclusivo(path: Path, registro: Dict[str, Any]) -> bool:
+    """Cria o arquivo de lease somente se ainda não existir (operação atômica no FS)."""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(registro, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _assumir_expirado(job_id: str, path: Path, visto: Dict[str, Any]) -> bool:
+    """
+    Assume um lease expirado. O rename para um tombstone exclusivo garante que apenas um nó vença
+    a disputa; se o conteúdo renomeado não for o lease expirado que lemos (outro nó já o renovou),
+    devolvemos o arquivo ao lugar e desistimos.
+    """
+    tombstone = path.with_name(f"{path.name}.stale.{uuid.uuid4().hex}")
+    try:
+        os.rename(path, tombstone)
+    except FileNotFoundError:
+        return False
+    capturado = _ler(tombstone) or {}
+    if capturado.get("dono") != visto.get("dono") or not _expirado(capturado):
+        try:
+            os.link(tombstone, path)
+        except OSError as e:
+            # O dono legítimo perderá o lease no próximo heartbeat (e abortará o job)
+            LOGGER.error(f"[{job_id}] Não foi possível devolver o lease de '{capturado.get('dono')}': {e}")
+        tombstone.unlink(missing_ok=True)
+        return False
+    tombstone.unlink(missing_ok=True)
+    LOGGER.warning(f"[{job_id}] Lease expirado de '{visto.get('dono')}' assumido por '{OWNER_ID}'.")
+    return _criar_exclusivo(path, _novo_registro(job_id))
+
+
+# =====================================================
+# 🔹 API pública
+# =====================================================
+
+def adquirir_lease(job_id: str) -> bool:
+    """
+    Tenta tomar posse do job. Retorna True se este processo é (ou passou a ser) o dono.
+    """
+    path = _lease_path(job_id)
+    obtido = not _em_renovacao(path) and _criar_exclusivo(path, _novo_registro(job_id))
+    if not obtido and not _em_renovacao(path):
+        atual = _ler(path)
+        if atual is None:
+            obtido = _criar_exclusivo(path, _novo_registro(job_id))  # removido entre as chamadas
+        elif atual.get("dono") == OWNER_ID:
+            obtido = True
+        elif _expirado(atual):
+            obtido = _assumir_expirado(job_id, path, atual)
+
+    if obtido:
+        with _LEASES_LOCK:
+            _LEASES_ATIVOS.add(job_id)
+        _garantir_heartbeat()
+        LOGGER.info(f"[{job_id}] Lease adquirido por {OWNER_ID}.")
+    else:
+        LOGGER.debug(f"[{job_id}] Job em posse de outro nó — ignorado.")
+    return obtido
+
+
+def renovar_lease(job_id: str) -> bool:
+    """
+    Renova o heartbeat de um lease próprio. Retorna False se a posse foi perdida.
+    Atômica em relação a _assumir_expirado: o lease é renomeado para um nome exclusivo antes da
+    checagem do dono, então um heartbeat atrasado nunca sobrescreve o lease que outro nó assumiu.
+    """
+    path = _lease_path(job_id)
+    with _ARQUIVO_LOCK:
+        renovado = _renovar(job_id, path)
+    if not renovado:
+        with _LEASES_LOCK:
+            _LEASES_ATIVOS.discard(job_id)
+    return renovado
+
+
+def _renovar(job_id: str, path: Path) -> bool:
+    aparte = path.with_name(f"{path.name}.renovando.{uuid.uuid4().hex}")
+    for tentativa in range(3):
+        try:
+            os.rename(path, aparte)
+            break
+        except FileNotFoundError:
+            # Outro nó pode estar conferindo o lease (tombstone) e devolvê-lo em seguida
+            time.sleep(0.05 * (tentativa + 1))
+    else:
+        LOGGER.error(f"[{job_id}] Lease perdido (arquivo de lease ausente).")
+        return False
+
+    capturado = _ler(aparte) or {}
+    if capturado.get("dono") != OWNER_ID:
+        # Não é nosso (outro nó assumiu): devolve intacto, sem sobrescrever um eventual lease novo
+        try:
+            os.link(aparte, path)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            LOGGER.error(f"[{job_id}] Não foi possível devolver o lease de '{capturado.get('dono')}': {e}")
+        aparte.unlink(missing_ok=True)
+        LOGGER.error(f"[{job_id}] Lease perdido (dono atual: {capturado.get('dono')}).")
+        return False
+
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(_novo_registro(job_id, capturado.get("adquirido_em")), f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            # Outro nó criou um lease enquanto o nosso estava fora do lugar: a posse é dele
+            LOGGER.error(f"[{job_id}] Lease perdido durante a renovação (criado por outro nó).")
+            return False
+        except OSError:
+            os.link(aparte, path)  # restaura o lease anterior (ainda nosso) e propaga a falha
+            raise
+    finally:
+        tmp.unlink(missing_ok=True)
+        aparte.unlink(missing_ok=True)
+    return True
+
+
+def liberar_lease(job_id: str) -> None:
+    """Remove o lease ao final do job (somente se ainda for o dono)."""
+    with _LEASES_LOCK:
+        _LEASES_ATIVOS.discard(job_id)
+    path = _lease_path(job_id)
+    with _ARQUIVO_LOCK:
+        atual = _ler(path)
+        if atual and atual.get("dono") == OWNER_ID:
+            path.unlink(missing_ok=True)
+            LOGGER.info(f"[{job_id}] Lease liberado.")
+
+
+def lease_disponivel(job_id: str) -> bool:
+    """True se o job não tem dono ou se o lease atual expirou (nó morto)."""
+    path = _lease_path(job_id)
+    atual = _ler(path)
+    return (atual is None and not _em_renovacao(path)) or (atual is not None and _expirado(atual))
+
+
+def possui_lease(job_id: str) -> bool:
+    with _LEASES_LOCK:
+        return job_id in _LEASES_ATIVOS
+
+
+def verificar_lease(job_id: str) -> None:
+    """
+    Levanta LeasePerdido se este nó não é mais o dono do job (heartbeat detectou a perda ou o
+    arquivo de lease aponta outro dono). Chamado entre as etapas e antes de mover o job.
+    """
+    with _ARQUIVO_LOCK:
+        atual = _ler(_lease_path(job_id))
+    if not possui_lease(job_id) or not atual or atual.get("dono") != OWNER_ID:
+        with _LEASES_LOCK:
+            _LEASES_ATIVOS.discard(job_id)
+        raise LeasePerdido(f"[{job_id}] Lease perdido (dono atual: {(atual or {}).get('dono')}).")
+
+
+# =====================================================
+# 🔹 Heartbeat em background
+# =====================================================
+
+def _loop_heartbeat() -> None:
+    while True:
+        time.sleep(LEASE_HEARTBEAT_SECONDS)
+        with _LEASES_LOCK:
+            ativos = list(_LEASES_ATIVOS)
+        for job_id in ativos:
+            try:
+                renovar_lease(job_id)
+            except Exception as e:
+                LOGGER.warning(f"[{job_id}] Falha ao renovar lease: {e}")
+
+
+def _garantir_heartbeat() -> None:
+    global _HEARTBEAT_THREAD
+    with _LEASES_LOCK:
+        if _HEARTBEAT_THREAD is None or not _HEARTBEAT_THREAD.is_alive():
+            _HEARTBEAT_THREAD = threading.Thread(target=_loop_heartbeat, name="lease-heartbeat", daemon=True)
+            _HEARTBEAT_THREAD.start()
@@ -7,9 +7,16 @@ LICITANET + OCR + OPENAI (v3).
 Funções:
 1. Registrar execuções concluídas (OCR, IA, SERPRO, etc.)
 2. Evitar reprocessamento desnecessário de PDFs já processados
-3. Manter histórico completo em formato JSONL (append-only)
+3. Manter histórico completo (append-only)
 
-Estrutura do ledger (logs/ledger.jsonl):
+Backends (LEDGER_BACKEND):
+- "sqlite" (padrão): logs/ledger.sqlite3, com índices em (job_id, arquivo_id, etapa) e hash_pdf —
+  consultas em tempo constante independentemente do tamanho do histórico.
+  Na primeira abertura, o logs/ledger.jsonl legado é importado automaticamente
+  (ou manualmente: python ledger.py --importar [caminho.jsonl]).
+- "jsonl": formato legado, um JSON por linha (cada consulta lê o arquivo inteiro).
+
+Estrutura de uma entrada:
 {
   "timestamp": "2025-11-04T10:32:55",
   "job_id": "job_001",
@@ -22,18 +29,295 @@ Estrutura do ledger (logs/ledger.jsonl):
 }
 """
 
+import atexit
 import json
 import os
+import queue
+import sqlite3
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional
+from filelock import FileLock
 from log_service import get_logger, safe_mkdir
 
 LOGGER = get_logger("ledger")
 
 LEDGER_PATH = Path("logs/ledger.jsonl")
+LEDGER_DB_PATH = Path(os.getenv("LEDGER_DB_PATH", str(LEDGER_PATH.with_suffix(".sqlite3"))))
+LEDGER_BACKEND = os.getenv("LEDGER_BACKEND", "sqlite").strip().lower()  # sqlite | jsonl
+# Escrita agrupada (group commit): um único writer por processo grava lotes de entradas
+LEDGER_FLUSH_INTERVAL_MS = int(os.getenv("LEDGER_FLUSH_INTERVAL_MS", "50"))
+LEDGER_BATCH_MAX = int(os.getenv("LEDGER_BATCH_MAX", "1000"))
+LEDGER_FSYNC = os.getenv("LEDGER_FSYNC", "lote").strip().lower()  # lote (fsync por lote) | nunca
+LEDGER_TENTATIVAS = max(1, int(os.getenv("LEDGER_TENTATIVAS", "5")))  # tentativas por lote antes do arquivo de pendentes
+# Lotes que não puderam ser gravados (ex.: "database is locked" persistente) vão para cá e são reimportados depois
+LEDGER_PENDENTES_PATH = LEDGER_PATH.with_name("ledger_pendentes.jsonl")
 safe_mkdir(LEDGER_PATH.parent)
 
+_CAMPOS = ("timestamp", "job_id", "arquivo_id", "etapa", "hash_pdf", "hash_md", "status", "observacao")
+
+# =====================================================
+# 🔹 Backend SQLite
+# =====================================================
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    arquivo_id TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    hash_pdf TEXT,
+    hash_md TEXT,
+    status TEXT,
+    observacao TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_job_arquivo_etapa ON ledger (job_id, arquivo_id, etapa, id);
+CREATE INDEX IF NOT EXISTS idx_ledger_arquivo ON ledger (arquivo_id);
+CREATE INDEX IF NOT EXISTS idx_ledger_hash_pdf ON ledger (hash_pdf);
+CREATE TABLE IF NOT EXISTS ledger_meta (chave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+_LOCAL = threading.local()
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_PRONTO = False
+
+
+def _conexao() -> sqlite3.Connection:
+    """Uma conexão por thread (sqlite3 não compartilha conexões entre threads com segurança)."""
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LEDGER_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute(f"PRAGMA synchronous={'FULL' if LEDGER_FSYNC == 'lote' else 'OFF'}")
+        _LOCAL.conn = conn
+        _garantir_schema(conn)
+    return conn
+
+
+def _garantir_schema(conn: sqlite3.Connection) -> None:
+    global _SCHEMA_PRONTO
+    with _SCHEMA_LOCK:
+        if _SCHEMA_PRONTO:
+            return
+        conn.executescript(_SCHEMA_SQL)
+        conn.commit()
+        # Dentro do lock: as demais threads só consultam depois da importação do legado
+        if LEDGER_PATH.exists() and _meta_get(conn, "jsonl_importado") is None:
+            importar_jsonl(LEDGER_PATH)
+        _SCHEMA_PRONTO = True
+
+
+def _meta_get(conn: sqlite3.Connection, chave: str) -> Optional[str]:
+    row = conn.execute("SELECT valor FROM ledger_meta WHERE chave = ?", (chave,)).fetchone()
+    return row["valor"] if row else None
+
+
+def _inserir_sqlite(entries: Iterable[Dict[str, Any]]) -> None:
+    conn = _conexao()
+    with conn:
+        conn.executemany(
+            f"INSERT INTO ledger ({', '.join(_CAMPOS)}) VALUES ({', '.join('?' for _ in _CAMPOS)})",
+            [tuple(e.get(c) for c in _CAMPOS) for e in entries],
+        )
+
+
+def _consultar_sqlite(where: str = "", params: tuple = (), limite: Optional[int] = None, desc: bool = False) -> list[Dict[str, Any]]:
+    flush_ledger()
+    sql = f"SELECT {', '.join(_CAMPOS)} FROM ledger"
+    if where:
+        sql += f" WHERE {where}"
+    sql += " ORDER BY id DESC" if desc else " ORDER BY id"
+    if limite:
+        sql += f" LIMIT {int(limite)}"
+    return [dict(r) for r in _conexao().execute(sql, params)]
+
+
+def importar_jsonl(path: str | Path = LEDGER_PATH, lote: int = 5000) -> int:
+    """
+    Importa um ledger.jsonl para o SQLite. A quantidade de linhas já importadas fica registrada
+    em ledger_meta: chamadas seguintes importam só as linhas acrescentadas depois.
+    Tudo (leitura do progresso, inserções e marcação) ocorre numa única transação BEGIN IMMEDIATE,
+    que trava a escrita entre threads e processos: importações concorrentes nunca duplicam linhas.
+    Retorna o número de entradas importadas nesta chamada.
+    """
+    path = Path(path)
+    conn = _conexao()
+    chave = f"jsonl_importado:{path.resolve().as_posix()}"
+    sql = f"INSERT INTO ledger ({', '.join(_CAMPOS)}) VALUES ({', '.join('?' for _ in _CAMPOS)})"
+    importadas = 0
+    linha_atual = 0
+    buffer: list[tuple] = []
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ja_importadas = int(_meta_get(conn, chave) or 0)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for linha_atual, line in enumerate(f, start=1):
+                    if linha_atual <= ja_importadas:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    buffer.append(tuple(entry.get(c) for c in _CAMPOS))
+                    importadas += 1
+                    if len(buffer) >= lote:
+                        conn.executemany(sql, buffer)
+                        buffer.clear()
+        if buffer:
+            conn.executemany(sql, buffer)
+        linha_atual = max(linha_atual, ja_importadas)
+        conn.execute("INSERT OR REPLACE INTO ledger_meta (chave, valor) VALUES (?, ?)", (chave, str(linha_atual)))
+        conn.execute("INSERT OR REPLACE INTO ledger_meta (chave, valor) VALUES ('jsonl_importado', ?)", (datetime.now().isoformat(),))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if importadas:
+        LOGGER.info(f"Ledger JSONL importado para SQLite: {importadas} entradas de {path}")
+    return importadas
+
+# =====================================================
+# 🔹 Writer único com group commit
+# =====================================================
+#
+# register_entry apenas enfileira; a thread writer junta as entradas que chegarem em até
+# LEDGER_FLUSH_INTERVAL_MS (máx. LEDGER_BATCH_MAX) e grava o lote de uma vez:
+# - sqlite: um único INSERT em lote por transação (locking do próprio SQLite entre processos)
+# - jsonl: um único write() de linhas completas sob file lock entre processos (ledger.jsonl.lock),
+#   seguido de fsync — linhas nunca se intercalam nem ficam truncadas.
+# Cada entrada recebe um número de sequência ao ser enfileirada; flush_ledger espera apenas até a
+# sequência vigente na chamada (marca d'água), sem depender de a fila esvaziar sob escrita contínua.
+
+_FILA: "queue.Queue[tuple[int, Dict[str, Any]]]" = queue.Queue()
+_WRITER: Optional[threading.Thread] = None
+_WRITER_LOCK = threading.Lock()
+_SEQ_COND = threading.Condition()
+_SEQ_ENFILEIRADA = 0  # última sequência enfileirada
+_SEQ_GRAVADA = 0  # última sequência concluída pelo writer (gravada ou desviada para pendentes)
+_JSONL_LOCK = FileLock(str(LEDGER_PATH) + ".lock")
+
+
+def _gravar_lote_jsonl(entries: list[Dict[str, Any]]) -> None:
+    dados = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+    with _JSONL_LOCK:
+        with open(LEDGER_PATH, "a", encoding="utf-8") as f:
+            f.write(dados)
+            f.flush()
+            if LEDGER_FSYNC == "lote":
+                os.fsync(f.fileno())
+
+
+_PENDENTES_LOCK = FileLock(str(LEDGER_PENDENTES_PATH) + ".lock")
+_HA_PENDENTES = LEDGER_PENDENTES_PATH.exists()
+
+
+def _gravar_pendentes(entries: list[Dict[str, Any]]) -> None:
+    dados = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+    with _PENDENTES_LOCK:
+        with open(LEDGER_PENDENTES_PATH, "a", encoding="utf-8") as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _reimportar_pendentes() -> None:
+    """Após um lote bem-sucedido, devolve ao ledger as entradas desviadas para o arquivo de pendentes."""
+    global _HA_PENDENTES
+    try:
+        with _PENDENTES_LOCK:
+            if LEDGER_BACKEND == "sqlite":
+                importar_jsonl(LEDGER_PENDENTES_PATH)  # idempotente: importa só as linhas novas
+            else:
+                with open(LEDGER_PENDENTES_PATH, "r", encoding="utf-8") as f:
+                    linhas = [json.loads(l) for l in f if l.strip()]
+                if linhas:
+                    _gravar_lote_jsonl(linhas)
+                LEDGER_PENDENTES_PATH.unlink(missing_ok=True)
+        _HA_PENDENTES = False
+        LOGGER.info(f"Ledger: entradas pendentes de {LEDGER_PENDENTES_PATH} reincorporadas.")
+    except Exception as e:
+        LOGGER.warning(f"Ledger: reimportação de pendentes adiada: {e}")
+
+
+def _gravar_lote(entries: list[Dict[str, Any]]) -> None:
+    """
+    Grava o lote com novas tentativas (backoff exponencial). Se todas falharem, o lote vai para
+    o arquivo de pendentes (nunca é descartado) e volta ao ledger no próximo lote bem-sucedido.
+    """
+    global _HA_PENDENTES
+    for tentativa in range(1, LEDGER_TENTATIVAS + 1):
+        try:
+            if LEDGER_BACKEND == "sqlite":
+                _inserir_sqlite(entries)
+            else:
+                _gravar_lote_jsonl(entries)
+            LOGGER.debug(f"Ledger: lote de {len(entries)} entrada(s) gravado.")
+            if _HA_PENDENTES:
+                _reimportar_pendentes()
+            return
+        except Exception as e:
+            LOGGER.warning(f"Falha ao gravar ledger ({len(entries)} entradas, tentativa {tentativa}/{LEDGER_TENTATIVAS}): {e}")
+            if tentativa < LEDGER_TENTATIVAS:
+                time.sleep(min(0.1 * 2 ** tentativa, 5.0))
+    try:
+        _gravar_pendentes(entries)
+        _HA_PENDENTES = True
+        LOGGER.error(f"Ledger indisponível — {len(entries)} entrada(s) salvas em {LEDGER_PENDENTES_PATH} para reimportação.")
+    except Exception as e:
+        LOGGER.critical(f"Ledger: {len(entries)} entrada(s) PERDIDAS (ledger e arquivo de pendentes falharam): {e}")
+
+
+def _loop_writer() -> None:
+    global _SEQ_GRAVADA
+    intervalo = LEDGER_FLUSH_INTERVAL_MS / 1000
+    while True:
+        lote = [_FILA.get()]
+        limite = time.monotonic() + intervalo
+        while len(lote) < LEDGER_BATCH_MAX:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(_FILA.get(timeout=restante))
+            except queue.Empty:
+                break
+        try:
+            _gravar_lote([entry for _, entry in lote])
+        finally:
+            with _SEQ_COND:
+                _SEQ_GRAVADA = max(_SEQ_GRAVADA, lote[-1][0])
+                _SEQ_COND.notify_all()
+
+
+def _garantir_writer() -> None:
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None or not _WRITER.is_alive():
+            _WRITER = threading.Thread(target=_loop_writer, name="ledger-writer", daemon=True)
+            _WRITER.start()
+
+
+def flush_ledger() -> None:
+    """
+    Bloqueia até as entradas enfileiradas ANTES desta chamada estarem gravadas (usado antes de
+    consultas e na saída). Entradas que chegarem durante a espera não a prolongam.
+    """
+    with _SEQ_COND:
+        alvo = _SEQ_ENFILEIRADA
+        while _SEQ_GRAVADA < alvo and _WRITER is not None and _WRITER.is_alive():
+            _SEQ_COND.wait(0.5)
+
+
+atexit.register(flush_ledger)
+
+
 # =====================================================
 # 🔹 Função principal: registrar execuções
 # =====================================================
@@ -50,6 +334,7 @@ def register_entry(
     """
     Registra uma nova entrada no ledger.
     Cada linha é um JSON independente (append-only).
+    A gravação é assíncrona e agrupada (ver _loop_writer); consultas fazem flush antes de ler.
     """
     entry = {
         "timestamp": datetime.now().isoformat(),
@@ -62,12 +347,12 @@ def register_entry(
         "observacao": observacao,
     }
 
-    try:
-        with open(LEDGER_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-        LOGGER.info(f"Ledger atualizado: {job_id}/{arquivo_id} ({etapa}) → {status}")
-    except Exception as e:
-        LOGGER.warning(f"Falha ao gravar ledger: {e}")
+    global _SEQ_ENFILEIRADA
+    _garantir_writer()
+    with _SEQ_COND:  # sequência e ordem na fila atribuídas juntas (o writer consome em ordem crescente)
+        _SEQ_ENFILEIRADA += 1
+        _FILA.put((_SEQ_ENFILEIRADA, entry))
+    LOGGER.debug(f"Ledger atualizado: {job_id}/{arquivo_id} ({etapa}) → {status}")
 
 
 # =====================================================
@@ -76,8 +361,9 @@ def register_entry(
 
 def _load_ledger() -> list[Dict[str, Any]]:
     """
-    Lê todo o conteúdo do ledger.jsonl e retorna como lista de dicts.
+    Lê todo o conteúdo do ledger.jsonl e retorna como lista de dicts (backend jsonl).
     """
+    flush_ledger()
     if not LEDGER_PATH.exists():
         return []
     with open(LEDGER_PATH, "r", encoding="utf-8") as f:
@@ -91,50 +377,71 @@ def _load_ledger() -> list[Dict[str, Any]]:
     return entries
 
 
+def _ultima_entrada(job_id: str, arquivo_id: str, etapa: str) -> Optional[Dict[str, Any]]:
+    """Entrada mais recente de (job_id, arquivo_id, etapa) — busca indexada no SQLite."""
+    if LEDGER_BACKEND == "sqlite":
+        rows = _consultar_sqlite("job_id = ? AND arquivo_id = ? AND etapa = ?", (job_id, arquivo_id, etapa), limite=1, desc=True)
+        return rows[0] if rows else None
+    relevant = [e for e in _load_ledger() if e["job_id"] == job_id and e["arquivo_id"] == arquivo_id and e["etapa"] == etapa]
+    return relevant[-1] if relevant else None
+
+
 # =====================================================
 # 🔹 Função de idempotência: decidir reprocessamento
 # =====================================================
 
+# Etapas afetadas por cada reprocess_scope
+ETAPAS_OCR = {"OCR", "OCR_CNH"}
+ETAPAS_IA = {"IA1", "IA2"}
+
+
 def should_reprocess(
     manifest: Dict[str, Any],
     job_id: str,
     arquivo_id: str,
     hash_pdf: str,
-    hash_md: str,
+    hash_md: Optional[str] = None,
+    etapa: str = "OCR",
 ) -> bool:
     """
-    Define se um PDF deve ser reprocessado com base nas regras:
-    - reprocessar=True no manifest → sempre reprocessa
-    - reprocess_scope="PDF|FULL" → reprocessa independente do hash
-    - reprocess_scope="OPENAI" → não reprocessa OCR
-    - AUTO_MANIFEST → reprocessa somente se hash_pdf mudou
+    Define se uma etapa deve ser reprocessada com base nas regras:
+    - reprocess_scope="FULL" → reprocessa todas as etapas
+    - reprocess_scope="PDF" → reprocessa as etapas de OCR (as demais seguem o fingerprint)
+    - reprocess_scope="OPENAI" → não reprocessa OCR; reprocessa IA1/IA2
+    - AUTO_MANIFEST (ou reprocessar=False) → reprocessa somente se o hash de entrada mudou
+
+    hash_pdf é o hash da entrada da etapa (PDF ou fingerprint da etapa); hash_md, se informado,
+    também precisa coincidir com a última execução.
     """
     # Regra explícita do manifest
     if manifest.get("reprocessar") is True:
         escopo = manifest.get("reprocess_scope", "AUTO_MANIFEST")
-        if escopo in ["PDF", "FULL"]:
-            LOGGER.info(f"[{job_id}/{arquivo_id}] Reprocessamento forçado ({escopo})")
+        if escopo == "FULL" or (escopo == "PDF" and etapa in ETAPAS_OCR):
+            LOGGER.info(f"[{job_id}/{arquivo_id}] Reprocessamento forçado de {etapa} ({escopo})")
             return True
         elif escopo == "OPENAI":
-            LOGGER.info(f"[{job_id}/{arquivo_id}] Escopo OPENAI — OCR não será reprocessado.")
-            return False
-        # AUTO_MANIFEST → avalia hashes
-        LOGGER.info(f"[{job_id}/{arquivo_id}] AUTO_MANIFEST ativado — verificando hash_pdf.")
+            if etapa in ETAPAS_IA:
+                LOGGER.info(f"[{job_id}/{arquivo_id}] Escopo OPENAI — {etapa} será reprocessada.")
+                return True
+            if etapa in ETAPAS_OCR:
+                LOGGER.info(f"[{job_id}/{arquivo_id}] Escopo OPENAI — OCR não será reprocessado.")
+                return False
+        else:
+            # AUTO_MANIFEST → avalia hashes
+            LOGGER.info(f"[{job_id}/{arquivo_id}] AUTO_MANIFEST ativado — verificando hash de {etapa}.")
 
     # Verifica histórico no ledger
-    entries = _load_ledger()
-    relevant = [e for e in entries if e["job_id"] == job_id and e["arquivo_id"] == arquivo_id and e["etapa"] == "OCR"]
-    if not relevant:
-        return True  # nunca processado antes
+    last_entry = _ultima_entrada(job_id, arquivo_id, etapa)
+    if last_entry is None or last_entry.get("status") != "OK":
+        return True  # nunca processado antes (ou última execução falhou)
 
-    last_entry = relevant[-1]  # mais recente
-    same_hash = last_entry.get("hash_pdf") == hash_pdf and last_entry.get("hash_md") == hash_md
+    same_hash = last_entry.get("hash_pdf") == hash_pdf and (hash_md is None or last_entry.get("hash_md") == hash_md)
 
     if same_hash:
-        LOGGER.info(f"[{job_id}/{arquivo_id}] Hashes iguais — pular reprocessamento (idempotência).")
+        LOGGER.info(f"[{job_id}/{arquivo_id}] Hashes iguais — pular reprocessamento de {etapa} (idempotência).")
         return False
     else:
-        LOGGER.info(f"[{job_id}/{arquivo_id}] Hashes diferentes — reprocessamento necessário.")
+        LOGGER.info(f"[{job_id}/{arquivo_id}] Hashes diferentes — reprocessamento de {etapa} necessário.")
         return True
 
 
@@ -146,6 +453,16 @@ def consultar_ledger(job_id: Optional[str] = None, arquivo_id: Optional[str] = N
     """
     Consulta o ledger filtrando por job_id e/ou arquivo_id.
     """
+    if LEDGER_BACKEND == "sqlite":
+        filtros, params = [], []
+        if job_id:
+            filtros.append("job_id = ?")
+            params.append(job_id)
+        if arquivo_id:
+            filtros.append("arquivo_id = ?")
+            params.append(arquivo_id)
+        return _consultar_sqlite(" AND ".join(filtros), tuple(params))
+
     entries = _load_ledger()
     if job_id:
         entries = [e for e in entries if e["job_id"] == job_id]
@@ -154,11 +471,28 @@ def consultar_ledger(job_id: Optional[str] = None, arquivo_id: Optional[str] = N
     return entries
 
 
+def consultar_por_hash_pdf(hash_pdf: str) -> list[Dict[str, Any]]:
+    """
+    Todas as execuções de um mesmo PDF (qualquer job), pelo hash do arquivo.
+    """
+    if LEDGER_BACKEND == "sqlite":
+        return _consultar_sqlite("hash_pdf = ?", (hash_pdf,))
+    return [e for e in _load_ledger() if e.get("hash_pdf") == hash_pdf]
+
+
 # =====================================================
-# 🔹 Teste rápido
+# 🔹 Teste rápido / importação
 # =====================================================
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--importar":
+        origem = sys.argv[2] if len(sys.argv) > 2 else LEDGER_PATH
+        total = importar_jsonl(origem)
+        print(f"{total} entradas importadas de {origem} para {LEDGER_DB_PATH}")
+        sys.exit(0)
+
     # Simulação básica
     register_entry(
         job_id="job_demo",
@@ -150,6 +150,7 @@ def init_folders() -> dict:
         "ERROR_DIR": Path(os.getenv("PATH_ERROR", "error")),
         "EVID_OCR_DIR": Path(os.getenv("PATH_EVIDENCIAS", "evidencias")) / "ocr",
         "LOG_DIR": Path(os.getenv("PATH_LOGS", "logs")),
+        "CACHE_DIR": Path(os.getenv("PATH_CACHE", "cache")),
     }
 
     # Cria apenas subdiretórios, ignora a raiz para evitar falsos-positivos de trava de sincronização
@@ -67,8 +67,10 @@ from watcher import detect_and_move_jobs
 from manifest_loader import load_manifest
 from ocr_router import executar_ocr
 from doc_verifier_agent import validar_documentos_openai
-from consulta_serpro import consultar_cnpj
+from consulta_serpro import consultar_cnpj_em_segundo_plano
 from relatorio import gerar_relatorio_final
+from entrada_comparativa import montar_entrada_comparativa
+from regras_deterministicas import avaliar_regras, dispensa_ia2, resultado_por_regras, salvar_fatos
 
 LOGGER = get_logger("main")
 
@@ -107,25 +109,25 @@ def executar_pipeline_manual(job_id: str, dirs: dict):
 
     LOGGER.bind(job_id=job_id, evento="DEBUG_EXEC").info("Executando pipeline manual para depuração...")
 
+    # === Etapa 0 - Consulta SERPRO em segundo plano (sobrepõe OCR/IA1) ===
+    serpro_future = consultar_cnpj_em_segundo_plano(manifest_data)
     # === Etapa 1 - OCR ===
     ocr_result = executar_ocr(job_id, manifest_data)
     # === Etapa 2 - IA Validador 1 ===
     ia1_result = validar_documentos_openai(job_id, ocr_result["dados_extraidos"], manifest_data)
-    # === Etapa 3 - Consulta SERPRO ===
-    serpro_result = consultar_cnpj(manifest_data)
-    # === Etapa 4 - IA Validador 2 ===
-    ia2_result = validar_documentos_openai(
-        job_id,
-        {
-            "dados_ocr": ocr_result.get("dados_extraidos", ""),
-            "dados_serpro": serpro_result.get("dados", {}),   # ← segue com dict vazio se houver erro/limite
-            "resultado_ia1": ia1_result.get("resultado", {}),
-            "serpro_disponivel": serpro_result.get("serpro_disponivel", False),
-            "serpro_status": serpro_result.get("status", "INDEFINIDO")
-        },
-        manifest_data,
-        modo="comparativo"
-    )
+    # === Etapa 3 - Consulta SERPRO (aguarda resultado) ===
+    serpro_result = serpro_future.result()
+    # === Etapa 3b - Regras determinísticas ===
+    fatos = avaliar_regras(manifest_data, ocr_result, serpro_result)
+    evid_fatos = salvar_fatos(job_id, fatos)
+    # === Etapa 4 - IA Validador 2 (dispensada se as regras já decidiram) ===
+    if dispensa_ia2(fatos):
+        ia2_result = resultado_por_regras(job_id, manifest_data, fatos, evid_fatos)
+    else:
+        entrada_ia2 = montar_entrada_comparativa(manifest_data, ocr_result, serpro_result, ia1_result, fatos)
+        entrada_ia2["serpro_disponivel"] = serpro_result.get("serpro_disponivel", False)
+        entrada_ia2["serpro_status"] = serpro_result.get("status", "INDEFINIDO")
+        ia2_result = validar_documentos_openai(job_id, entrada_ia2, manifest_data, modo="comparativo")
     # === Etapa 5 - Relatório Final ===
     gerar_relatorio_final(job_id, manifest_data, ocr_result, ia1_result, serpro_result, ia2_result)
 
@@ -4,14 +4,20 @@
 
 from __future__ import annotations
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from log_service import get_logger
 from jsonschema import Draft202012Validator, ValidationError
 
 # Logger unificado do projeto
 LOGGER = get_logger("manifest_loader")
 
+# Paralelismo da validação em lote (validate_many / CLI --lote)
+MANIFEST_VALIDACAO_WORKERS = max(1, int(os.getenv("MANIFEST_VALIDACAO_WORKERS", str(min(32, (os.cpu_count() or 1) * 4)))))
+
 
 # Validação de schema
 from jsonschema import Draft202012Validator, ValidationError
@@ -69,12 +75,19 @@ _SCHEMA_V3_FALLBACK: Dict[str, Any] = {
 }
 
 
+_SCHEMA_PATH = Path("schemas") / "manifest_v3.json"
+
+# Validador compilado uma vez por processo; recompilado só quando o mtime do schema externo muda
+_VALIDADOR_CACHE: Dict[str, Any] = {"mtime": None, "validador": None}
+_VALIDADOR_LOCK = threading.Lock()
+
+
 def _load_external_schema_if_exists() -> Dict[str, Any]:
     """
     Se existir ./schemas/manifest_v3.json, usa-o como schema.
     Caso contrário, usa o fallback interno.
     """
-    candidate = Path("schemas") / "manifest_v3.json"
+    candidate = _SCHEMA_PATH
     if candidate.exists():
         try:
             with candidate.open("r", encoding="utf-8") as f:
@@ -90,6 +103,21 @@ def _load_external_schema_if_exists() -> Dict[str, Any]:
     return _SCHEMA_V3_FALLBACK
 
 
+def _get_validator() -> Draft202012Validator:
+    """Retorna o validador compilado, recarregando o schema apenas se o arquivo mudou (mtime)."""
+    try:
+        mtime: Optional[float] = _SCHEMA_PATH.stat().st_mtime
+    except OSError:
+        mtime = None  # sem schema externo → fallback interno
+    with _VALIDADOR_LOCK:
+        if _VALIDADOR_CACHE["validador"] is None or _VALIDADOR_CACHE["mtime"] != mtime:
+            schema = _load_external_schema_if_exists()
+            Draft202012Validator.check_schema(schema)
+            _VALIDADOR_CACHE["validador"] = Draft202012Validator(schema)
+            _VALIDADOR_CACHE["mtime"] = mtime
+        return _VALIDADOR_CACHE["validador"]
+
+
 def _get_manifest_path(job_dir: Path) -> Path:
     return job_dir / "manifest.json"
 
@@ -152,8 +180,7 @@ def _apply_defaults_and_normalize(manifest: Dict[str, Any]) -> Dict[str, Any]:
     return manifest
 
 
-def _validate_manifest(manifest: Dict[str, Any], schema: Dict[str, Any]) -> None:
-    validator = Draft202012Validator(schema)
+def _validate_manifest(manifest: Dict[str, Any], validator: Draft202012Validator) -> None:
     errors = sorted(validator.iter_errors(manifest), key=lambda e: e.path)
     if errors:
         msgs = []
@@ -194,7 +221,7 @@ def _save_normalized_manifest(job_dir: Path, manifest: Dict[str, Any]) -> Path:
         return out
 
 
-def load_manifest(job_dir: str | Path, strict_files: bool = True) -> Dict[str, Any]:
+def load_manifest(job_dir: str | Path, strict_files: bool = True, salvar_normalizado: bool = True) -> Dict[str, Any]:
     """
     Carrega, valida e normaliza o manifest.json de um job.
 
@@ -202,6 +229,7 @@ def load_manifest(job_dir: str | Path, strict_files: bool = True) -> Dict[str, A
       job_dir: caminho da pasta do job (ex.: /inbox/YYYY/MM/DD/<job_id> ou /processing/<job_id>)
       strict_files: se True, lança erro quando arquivos do manifest não existem
                     (útil após estágio watcher→processing). Se False, apenas loga aviso.
+      salvar_normalizado: se False, não grava manifest.normalizado.json (validação prévia em lote).
 
     Returns:
       Um dicionário com o manifest normalizado (schema v3), pronto para uso no pipeline.
@@ -230,12 +258,12 @@ def load_manifest(job_dir: str | Path, strict_files: bool = True) -> Dict[str, A
     # 4) Normaliza defaults ANTES da validação (permite None em enums etc.)
     raw = _apply_defaults_and_normalize(raw)
 
-    # 5) Carrega schema (externo se existir, senão fallback interno)
-    schema = _load_external_schema_if_exists()
+    # 5) Validador compilado (schema externo se existir, senão fallback interno)
+    validator = _get_validator()
 
     # 6) Valida contra schema
     try:
-        _validate_manifest(raw, schema)
+        _validate_manifest(raw, validator)
     except ValidationError as e:
         LOGGER.exception(f"[MANIFEST] Estrutura inválida: {e}")
         raise
@@ -252,8 +280,9 @@ def load_manifest(job_dir: str | Path, strict_files: bool = True) -> Dict[str, A
             LOGGER.warning(msg)
 
     # 8) Salva cópia normalizada para auditoria / AUTO_MANIFEST
-    out_norm = _save_normalized_manifest(job_dir, raw)
-    LOGGER.info(f"Manifest carregado e normalizado para job_dir='{job_dir.as_posix()}' → '{out_norm.name}'")
+    if salvar_normalizado:
+        out_norm = _save_normalized_manifest(job_dir, raw)
+        LOGGER.info(f"Manifest carregado e normalizado para job_dir='{job_dir.as_posix()}' → '{out_norm.name}'")
 
     # 9) Agora sim: podemos logar as chaves do manifest carregado
     try:
@@ -264,20 +293,63 @@ def load_manifest(job_dir: str | Path, strict_files: bool = True) -> Dict[str, A
 
     return raw
 
+
+
+def validate_many(
+    job_dirs: Iterable[str | Path],
+    strict_files: bool = True,
+    max_workers: int = MANIFEST_VALIDACAO_WORKERS,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Valida vários jobs em paralelo (pré-checagem de uploads em lote), sem gravar
+    manifest.normalizado.json. O schema é compilado uma única vez para todo o lote.
+
+    Returns:
+      {job_dir: {"ok": bool, "job_id": str | None, "erro": str | None}}
+    """
+    job_dirs = [Path(d) for d in job_dirs]
+    _get_validator()  # compila antes de distribuir entre as threads
+
+    def _validar(job_dir: Path) -> Dict[str, Any]:
+        try:
+            manifest = load_manifest(job_dir, strict_files=strict_files, salvar_normalizado=False)
+            return {"ok": True, "job_id": manifest.get("job_id"), "erro": None}
+        except Exception as e:
+            return {"ok": False, "job_id": None, "erro": f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="manifest") as pool:
+        resultados = list(pool.map(_validar, job_dirs))
+    return {d.as_posix(): r for d, r in zip(job_dirs, resultados)}
+
+
 # -----------------------------
 # CLI rápido (opcional p/ debug)
 # -----------------------------
 if __name__ == "__main__":
     import argparse
+    import sys
     parser = argparse.ArgumentParser(description="Valida e normaliza manifest.json (schema v3)")
-    parser.add_argument("job_dir", help="Caminho da pasta do job (com manifest.json)")
+    parser.add_argument("job_dir", nargs="+", help="Caminho da pasta do job (com manifest.json); com --lote, pastas raiz")
     parser.add_argument("--no-strict", action="store_true", help="Não falha se arquivos do manifest não existirem")
+    parser.add_argument("--lote", action="store_true", help="Valida em paralelo todos os jobs (manifest.json) sob as pastas informadas")
     args = parser.parse_args()
 
+    if args.lote or len(args.job_dir) > 1:
+        alvos = []
+        for raiz in args.job_dir:
+            raiz = Path(raiz)
+            alvos.extend(sorted(p.parent for p in raiz.rglob("manifest.json")) if args.lote else [raiz])
+        resultado = validate_many(alvos, strict_files=not args.no_strict)
+        falhas = {d: r for d, r in resultado.items() if not r["ok"]}
+        for d, r in falhas.items():
+            print(f"[ERRO] {d}: {r['erro']}")
+        print(f"{len(resultado) - len(falhas)}/{len(resultado)} manifest(s) válidos.")
+        sys.exit(1 if falhas else 0)
+
     try:
-        manifest = load_manifest(args.job_dir, strict_files=not args.no_strict)
+        manifest = load_manifest(args.job_dir[0], strict_files=not args.no_strict)
         print(json.dumps(manifest, ensure_ascii=False, indent=2))
-        LOGGER.info("Manifest OK em '{}'", args.job_dir)
+        LOGGER.info("Manifest OK em '{}'", args.job_dir[0])
     except Exception as e:
-        LOGGER.exception("Falha ao processar manifest em '{}': {}", args.job_dir, e)
+        LOGGER.exception("Falha ao processar manifest em '{}': {}", args.job_dir[0], e)
         raise
@@ -3,21 +3,53 @@
 # Substitui o ponto de entrada antigo: extrator_docling.executar_ocr
 
 import os
+import hashlib
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, List
 
 from log_service import get_logger, init_folders, safe_mkdir
 from cnh_ocr import process_cnh
-from extrator_docling import extrair_com_docling, extrair_com_tesseract, localizar_arquivo
+from extrator_docling import (
+    OCR_CAMADA_TEXTO,
+    OCR_MIN_CHARS_PAGINA,
+    extrair_com_camada_texto,
+    extrair_com_docling,
+    extrair_com_tesseract,
+    localizar_arquivo,
+)
+from ocr_tesseract import OCR_TESSERACT_DPI, TESSERACT_CONFIG, TESSERACT_LANG
+from cache_disco import CacheDisco, calcular_chave
+from checkpoint import hash_arquivo
+import ledger
 
 LOGGER = get_logger("ocr_router")
 DIRS = init_folders()
 
-def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+# Cache de OCR endereçado por conteúdo (SHA-256 do arquivo + extrator + versão + config)
+OCR_CACHE_ATIVO = os.getenv("OCR_CACHE", "true").strip().lower() in ("1", "true", "sim", "yes")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+OCR_CACHE_VERSAO = "1"  # incrementar quando a lógica de extração mudar
+OCR_CACHE = CacheDisco("ocr", Path(DIRS["CACHE_DIR"]) / "ocr", max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _chave_cache_ocr(caminho: str, rota: str) -> str:
+    """Chave do cache: qualquer mudança no arquivo, na rota ou na configuração gera outra chave."""
+    config = {
+        "camada_texto": OCR_CAMADA_TEXTO,
+        "min_chars_pagina": OCR_MIN_CHARS_PAGINA,
+        "dpi": OCR_TESSERACT_DPI,
+        "lang": TESSERACT_LANG,
+        "tesseract_config": TESSERACT_CONFIG,
+    } if rota == "PADRAO" else {}
+    return calcular_chave(hash_arquivo(caminho), rota, OCR_CACHE_VERSAO, config)
+
+
+def executar_ocr(job_id: str, manifest: Dict[str, Any], forcar: bool = False) -> Dict[str, Any]:
     """
     Controlador principal de OCR.
     Itera sobre os arquivos do manifest e decide qual extrator usar.
+    forcar=True (reprocess_scope PDF/FULL) ignora o cache de OCR e reextrai os arquivos.
     """
     evid_dir = Path(DIRS["EVID_OCR_DIR"]) / job_id
     safe_mkdir(evid_dir)
@@ -45,11 +77,51 @@ def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
                 is_cnh = True
                 LOGGER.info(f"Detectado CNH pelo nome do arquivo: {nome}")
 
+        # --- CACHE DE OCR ---
+        chave_cache = None
+        em_cache = None
+        if OCR_CACHE_ATIVO:
+            try:
+                chave_cache = _chave_cache_ocr(caminho_pdf, "CNH" if is_cnh else "PADRAO")
+                em_cache = None if forcar else OCR_CACHE.obter(chave_cache)
+            except Exception as e:
+                LOGGER.warning(f"Cache de OCR indisponível para {nome}: {e}")
+            if em_cache:
+                LOGGER.bind(job_id=job_id, arquivo=nome, evento="CACHE_OCR").info(
+                    f"Cache hit para {nome} (idade {em_cache['idade_segundos']:.0f}s) — extração pulada."
+                )
+
         if is_cnh:
             # Rota Especializada: CNH
             LOGGER.info(f"Roteando {nome} para CNH OCR.")
             try:
-                res = process_cnh(caminho_pdf, job_id, arquivo["id"], manifest)
+                if em_cache:
+                    valor = em_cache["valor"]
+                    md_path = evid_dir / f"{arquivo['id']}_cnh.md"
+                    with open(md_path, "w", encoding="utf-8") as f:
+                        f.write(valor["conteudo_markdown"])
+                    res = {
+                        "conteudo_markdown": valor["conteudo_markdown"],
+                        "cnh_json": valor.get("cnh_json"),
+                        "evidencias": {"markdown": str(md_path)},
+                    }
+                    # Mesmo registro que process_cnh faria (histórico e should_reprocess)
+                    ledger.register_entry(
+                        job_id=job_id,
+                        arquivo_id=arquivo["id"],
+                        etapa="OCR_CNH",
+                        hash_pdf=hash_arquivo(caminho_pdf),
+                        hash_md=hashlib.sha256(valor["conteudo_markdown"].encode("utf-8")).hexdigest(),
+                        status="OK",
+                        observacao="Processamento CNH Especializado (cache de OCR)",
+                    )
+                else:
+                    res = process_cnh(caminho_pdf, job_id, arquivo["id"], manifest)
+                    if chave_cache and res.get("status") != "ERRO":
+                        OCR_CACHE.gravar(chave_cache, {
+                            "conteudo_markdown": res.get("conteudo_markdown", ""),
+                            "cnh_json": res.get("cnh_json"),
+                        })
                 
                 # Adapta retorno do process_cnh para lista de resultados
                 resultados.append({
@@ -58,7 +130,8 @@ def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
                     "evidencia": res["evidencias"]["markdown"],
                     "status": "OK",
                     "tamanho_texto": len(res.get("conteudo_markdown", "")),
-                    "cnh_metadata": res.get("cnh_json")
+                    "cnh_metadata": res.get("cnh_json"),
+                    "cache": bool(em_cache)
                 })
                 texto_consolidado += f"\n\n# {nome} (CNH OCR)\n{res.get('conteudo_markdown', '')}"
                 
@@ -67,18 +140,28 @@ def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
                 resultados.append({"arquivo": nome, "status": "ERRO", "erro": str(e)})
 
         else:
-            # Rota Padrão: Docling + Tesseract Fallback
+            # Rota Padrão: camada de texto nativa por página → Docling + Tesseract Fallback
             LOGGER.info(f"Roteando {nome} para Pipeline Padrão (Docling).")
             try:
-                # Lógica replicada de extrator_docling.py
-                texto_docling = extrair_com_docling(caminho_pdf)
-                if texto_docling and len(texto_docling.strip()) > 200:
-                    texto_extraido = texto_docling
-                    metodo = "Docling"
+                nativo = extrair_com_camada_texto(caminho_pdf) if not em_cache else None
+                if em_cache:
+                    texto_extraido = em_cache["valor"]["texto"]
+                    metodo = em_cache["valor"]["metodo"]
+                elif nativo:
+                    texto_extraido, metodo = nativo
                 else:
-                    texto_ocr = extrair_com_tesseract(caminho_pdf)
-                    texto_extraido = texto_ocr
-                    metodo = "Tesseract"
+                    # Lógica replicada de extrator_docling.py
+                    texto_docling = extrair_com_docling(caminho_pdf)
+                    if texto_docling and len(texto_docling.strip()) > 200:
+                        texto_extraido = texto_docling
+                        metodo = "Docling"
+                    else:
+                        texto_ocr = extrair_com_tesseract(caminho_pdf)
+                        texto_extraido = texto_ocr
+                        metodo = "Tesseract"
+
+                if chave_cache and not em_cache and texto_extraido.strip():
+                    OCR_CACHE.gravar(chave_cache, {"texto": texto_extraido, "metodo": metodo})
                 
                 # Salvar Evidência
                 markdown_path = evid_dir / f"{Path(nome).stem}_{metodo}.md"
@@ -90,7 +173,8 @@ def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
                     "metodo": metodo,
                     "evidencia": str(markdown_path),
                     "status": "OK",
-                    "tamanho_texto": len(texto_extraido)
+                    "tamanho_texto": len(texto_extraido),
+                    "cache": bool(em_cache)
                 })
                 
                 texto_consolidado += f"\n\n# {nome} ({metodo})\n{texto_extraido}"
@@ -106,6 +190,7 @@ def executar_ocr(job_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
         "evidencias_dir": str(evid_dir),
         "dados_extraidos": texto_consolidado,
         "arquivos": resultados,
+        "cache_ocr": OCR_CACHE.estatisticas() if OCR_CACHE_ATIVO else None,
         "data_execucao": datetime.now().isoformat()
     }
     
@@ -0,0 +1,154 @@
+"""
+ocr_tesseract.py
+-----------------
+OCR Tesseract página a página em um pool de processos.
+
+Fluxo:
+1. Descobre o número de páginas do PDF (pdfinfo)
+2. Distribui as páginas entre os workers; cada worker rasteriza APENAS a sua página
+   (convert_from_path com first_page/last_page) e aplica o Tesseract
+3. Remonta o texto na ordem original ("--- Página N ---")
+
+Módulo propositalmente leve (sem Docling/torch): os workers nascem de um forkserver que
+pré-carrega somente este arquivo e NÃO reexecutam o script de entrada do processo pai
+(watcher.py/main.py, que importam Docling/torch). Sem forkserver (Windows), usa "spawn".
+
+Variáveis de ambiente:
+- OCR_TESSERACT_WORKERS: tamanho do pool (padrão: número de núcleos)
+- OCR_TESSERACT_DPI: resolução de rasterização (padrão: 300)
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+from multiprocessing import context, reduction, spawn, util
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+import pytesseract
+
+from log_service import get_logger
+from rasterizador import contar_paginas, rasterizar_pagina
+
+OCR_TESSERACT_WORKERS = max(1, int(os.getenv("OCR_TESSERACT_WORKERS", str(os.cpu_count() or 1))))
+OCR_TESSERACT_DPI = int(os.getenv("OCR_TESSERACT_DPI", "300"))
+TESSERACT_LANG = "por+eng"
+TESSERACT_CONFIG = "--psm 6"
+
+LOGGER = get_logger("ocr_tesseract")
+
+# forkserver não existe no Windows: lá os workers usam "spawn" (e reimportam o __main__)
+_TEM_FORKSERVER = "forkserver" in multiprocessing.get_all_start_methods()
+if _TEM_FORKSERVER:
+    from multiprocessing import forkserver, popen_forkserver
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _init_worker() -> None:
+    """Cada worker já ocupa um núcleo: limita o OpenMP interno do Tesseract a 1 thread."""
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _ocr_pagina(path_pdf: str, pagina: int, dpi: int) -> str:
+    """Rasteriza e aplica OCR em uma única página (executado dentro do worker)."""
+    imagem = rasterizar_pagina(path_pdf, pagina, dpi)
+    if imagem is None:
+        return ""
+    return pytesseract.image_to_string(imagem, lang=TESSERACT_LANG, config=TESSERACT_CONFIG)
+
+
+if _TEM_FORKSERVER:
+    class _PopenSemMain(popen_forkserver.Popen):
+        """
+        Popen do forkserver sem as chaves init_main_from_* nos dados de preparação: por padrão o
+        worker reexecuta o __main__ do pai (e toda a cadeia de imports dele) antes de rodar a tarefa.
+        As tarefas daqui só referenciam funções deste módulo, já pré-carregado no forkserver.
+        """
+
+        def _launch(self, process_obj):
+            prep_data = spawn.get_preparation_data(process_obj._name)
+            prep_data.pop("init_main_from_path", None)
+            prep_data.pop("init_main_from_name", None)
+            buf = io.BytesIO()
+            context.set_spawning_popen(self)
+            try:
+                reduction.dump(prep_data, buf)
+                reduction.dump(process_obj, buf)
+            finally:
+                context.set_spawning_popen(None)
+
+            self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+            _parent_w = os.dup(w)
+            self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+            with open(w, "wb", closefd=True) as f:
+                f.write(buf.getbuffer())
+            self.pid = forkserver.read_signed(self.sentinel)
+
+
+    class _ProcessoOCR(context.ForkServerProcess):
+        @staticmethod
+        def _Popen(process_obj):
+            return _PopenSemMain(process_obj)
+
+
+    class _ContextoOCR(context.ForkServerContext):
+        Process = _ProcessoOCR
+
+
+def _contexto_workers() -> multiprocessing.context.BaseContext:
+    if not _TEM_FORKSERVER:
+        return multiprocessing.get_context("spawn")
+    ctx = _ContextoOCR()
+    ctx.set_forkserver_preload(["ocr_tesseract"])
+    return ctx
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(
+                max_workers=OCR_TESSERACT_WORKERS,
+                mp_context=_contexto_workers(),
+                initializer=_init_worker,
+            )
+        return _POOL
+
+
+def _descartar_pool(pool: ProcessPoolExecutor) -> None:
+    """Encerra um pool quebrado (worker morto por OOM/segfault); o próximo _get_pool cria outro."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_paginas_paralelo(path_pdf: str, paginas: Optional[List[int]] = None, dpi: int = OCR_TESSERACT_DPI) -> List[str]:
+    """
+    Aplica OCR nas páginas informadas (1-based; padrão: todas) e retorna os textos
+    na mesma ordem da lista de páginas.
+    """
+    if paginas is None:
+        paginas = list(range(1, contar_paginas(path_pdf) + 1))
+    if not paginas:
+        return []
+    if OCR_TESSERACT_WORKERS <= 1 or len(paginas) == 1:
+        return [_ocr_pagina(path_pdf, p, dpi) for p in paginas]
+
+    for tentativa in (1, 2):
+        pool = _get_pool()
+        try:
+            futures = [pool.submit(_ocr_pagina, path_pdf, p, dpi) for p in paginas]
+            return [f.result() for f in futures]
+        except BrokenProcessPool as e:
+            _descartar_pool(pool)
+            LOGGER.warning(f"Pool do Tesseract quebrado (tentativa {tentativa}/2) — recriando: {e}")
+
+    # Dois pools quebrados seguidos (ex.: página que derruba o worker): OCR sequencial neste processo
+    LOGGER.warning(f"OCR paralelo indisponível para {os.path.basename(path_pdf)} — executando em série.")
+    return [_ocr_pagina(path_pdf, p, dpi) for p in paginas]
@@ -0,0 +1,192 @@
+"""
+orcamento_tokens.py
+--------------------
+Orçamento de tokens do texto OCR enviado à OpenAI.
+
+Fluxo:
+1. Divide o texto consolidado do OCR por documento (cabeçalhos "# <arquivo> (<método>)")
+2. Mede os tokens de cada documento (tiktoken, se instalado; senão estimativa ~4 caracteres/token)
+3. Se o total passar do orçamento do modo, compacta primeiro o conteúdo de baixo valor
+   (espaços repetidos, linhas sem letras/dígitos, linhas repetidas como cabeçalhos/rodapés de página)
+4. Se ainda passar, distribui o orçamento entre os documentos (os pequenos ficam inteiros) e
+   trunca os maiores preservando início e fim
+5. Devolve o texto final e um relatório do que foi cortado (gravado nas evidências da IA)
+
+Variáveis de ambiente:
+- OPENAI_ORCAMENTO_PADRAO: orçamento de entrada do IA Validador 1 (padrão: 60000 tokens)
+- OPENAI_ORCAMENTO_COMPARATIVO: orçamento do texto OCR no IA Validador 2 (padrão: 30000 tokens)
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+from log_service import get_logger
+
+LOGGER = get_logger("orcamento_tokens")
+
+OPENAI_ORCAMENTO_PADRAO = int(os.getenv("OPENAI_ORCAMENTO_PADRAO", "60000"))
+OPENAI_ORCAMENTO_COMPARATIVO = int(os.getenv("OPENAI_ORCAMENTO_COMPARATIVO", "30000"))
+_CHARS_POR_TOKEN = 4
+_FRACAO_INICIO = 0.7  # ao truncar, 70% do orçamento do documento fica com o início e 30% com o fim
+
+# Cabeçalhos gravados pelo ocr_router ("# <arquivo> (<método>)"); títulos "# " do markdown do Docling não casam
+_RE_DOCUMENTO = re.compile(r"(?m)^# .+ \((?:CNH OCR|Docling|Tesseract|TextoNativo|Misto)\)$")
+_RE_MARCADOR_PAGINA = re.compile(r"^-{3}( Página \d+ -{3})?$")
+_RE_ESPACOS = re.compile(r"[ \t]+")
+_RE_LINHAS_VAZIAS = re.compile(r"\n{3,}")
+
+_ENCODERS: Dict[str, Any] = {}
+
+
+def orcamento_para(modo: str) -> int:
+    """Orçamento de tokens de entrada para o modo de validação."""
+    return OPENAI_ORCAMENTO_COMPARATIVO if modo == "comparativo" else OPENAI_ORCAMENTO_PADRAO
+
+
+def _encoder(modelo: str):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    if modelo not in _ENCODERS:
+        try:
+            try:
+                _ENCODERS[modelo] = tiktoken.encoding_for_model(modelo)
+            except KeyError:
+                _ENCODERS[modelo] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # BPE indisponível (download bloqueado, sem rede, cache corrompido): estimativa por caracteres
+            LOGGER.warning(f"tiktoken indisponível para {modelo} ({e}) — contagem de tokens estimada por caracteres.")
+            _ENCODERS[modelo] = None
+    return _ENCODERS[modelo]
+
+
+def contar_tokens(texto: str, modelo: str = "gpt-4o") -> int:
+    enc = _encoder(modelo)
+    if enc is None:
+        return (len(texto) + _CHARS_POR_TOKEN - 1) // _CHARS_POR_TOKEN
+    return len(enc.encode(texto, disallowed_special=()))
+
+
+def _cortar(texto: str, inicio: int, fim: int, modelo: str) -> Tuple[str, str]:
+    """Retorna (primeiros `inicio` tokens, últimos `fim` tokens)."""
+    enc = _encoder(modelo)
+    if enc is None:
+        a, b = inicio * _CHARS_POR_TOKEN, fim * _CHARS_POR_TOKEN
+        return texto[:a], (texto[-b:] if b else "")
+    tokens = enc.encode(texto, disallowed_special=())
+    return enc.decode(tokens[:inicio]), (enc.decode(tokens[-fim:]) if fim else "")
+
+
+# =====================================================
+# 🔹 Documentos
+# =====================================================
+
+def dividir_documentos(texto: str) -> List[Tuple[str, str]]:
+    """Divide o texto consolidado em [(cabeçalho, corpo)]; texto antes do 1º cabeçalho vira ("", corpo)."""
+    cabecalhos = list(_RE_DOCUMENTO.finditer(texto))
+    if not cabecalhos:
+        return [("", texto)]
+    docs = []
+    if texto[:cabecalhos[0].start()].strip():
+        docs.append(("", texto[:cabecalhos[0].start()]))
+    for i, m in enumerate(cabecalhos):
+        fim = cabecalhos[i + 1].start() if i + 1 < len(cabecalhos) else len(texto)
+        docs.append((m.group(0), texto[m.end():fim]))
+    return docs
+
+
+def compactar(texto: str) -> str:
+    """Remove conteúdo de baixo valor sem perder informação textual relevante."""
+    linhas_vistas = set()
+    saida = []
+    for linha in texto.splitlines():
+        linha = _RE_ESPACOS.sub(" ", linha).strip()
+        if _RE_MARCADOR_PAGINA.match(linha):
+            saida.append(linha)
+            continue
+        if linha and not any(c.isalnum() for c in linha):
+            continue  # ruído de OCR / separadores
+        if len(linha) > 3 and linha in linhas_vistas:
+            continue  # cabeçalhos e rodapés repetidos em todas as páginas
+        linhas_vistas.add(linha)
+        saida.append(linha)
+    return _RE_LINHAS_VAZIAS.sub("\n\n", "\n".join(saida))
+
+
+def _distribuir(tamanhos: List[int], orcamento: int) -> List[int]:
+    """Water-filling: documentos menores que a parte justa ficam inteiros; o resto é dividido entre os maiores."""
+    cotas = [0] * len(tamanhos)
+    pendentes = sorted(range(len(tamanhos)), key=lambda i: tamanhos[i])
+    restante = orcamento
+    while pendentes:
+        parte = restante // len(pendentes)
+        i = pendentes[0]
+        if tamanhos[i] <= parte:
+            cotas[i] = tamanhos[i]
+            restante -= tamanhos[i]
+            pendentes.pop(0)
+        else:
+            for j in pendentes:
+                cotas[j] = parte
+            break
+    return cotas
+
+
+# =====================================================
+# 🔹 API pública
+# =====================================================
+
+def aplicar_orcamento(texto: str, orcamento: int, modelo: str = "gpt-4o") -> Tuple[str, Dict[str, Any]]:
+    """
+    Ajusta o texto ao orçamento de tokens. Retorna (texto_final, relatorio), onde o relatório
+    indica, por documento, tokens originais/finais e se houve compactação ou truncamento.
+    """
+    docs = dividir_documentos(texto)
+    originais = [contar_tokens(cab + corpo, modelo) for cab, corpo in docs]
+    relatorio: Dict[str, Any] = {
+        "orcamento": orcamento,
+        "tokenizador": "tiktoken" if TIKTOKEN_AVAILABLE else f"estimativa ({_CHARS_POR_TOKEN} caracteres/token)",
+        "tokens_originais": sum(originais),
+        "tokens_finais": sum(originais),
+        "ajustado": False,
+        "documentos": [
+            {"documento": cab.lstrip("# ").strip() or "<sem cabeçalho>", "tokens_originais": n,
+             "tokens_finais": n, "compactado": False, "truncado": False}
+            for (cab, _), n in zip(docs, originais)
+        ],
+    }
+    if sum(originais) <= orcamento:
+        return texto, relatorio
+
+    # 1) Compactação de conteúdo de baixo valor (todos os documentos)
+    corpos = [compactar(corpo) for _, corpo in docs]
+    atuais = [contar_tokens(cab + "\n" + corpo, modelo) for (cab, _), corpo in zip(docs, corpos)]
+    for info, n in zip(relatorio["documentos"], atuais):
+        info["compactado"] = n < info["tokens_originais"]
+        info["tokens_finais"] = n
+
+    # 2) Truncamento proporcional (início + fim) dos documentos que excedem a cota
+    if sum(atuais) > orcamento:
+        cotas = _distribuir(atuais, orcamento)
+        for i, ((cab, _), cota) in enumerate(zip(docs, cotas)):
+            if atuais[i] <= cota:
+                continue
+            disponivel = max(0, cota - contar_tokens(cab, modelo) - 16)
+            inicio, fim = _cortar(corpos[i], int(disponivel * _FRACAO_INICIO), disponivel - int(disponivel * _FRACAO_INICIO), modelo)
+            omitidos = atuais[i] - disponivel
+            corpos[i] = f"{inicio}\n\n[... {omitidos} tokens omitidos para caber no orçamento ...]\n\n{fim}"
+            info = relatorio["documentos"][i]
+            info["truncado"] = True
+            info["tokens_finais"] = contar_tokens(cab + "\n" + corpos[i], modelo)
+
+    partes = [(f"\n\n{cab}\n" if cab else "") + corpo for (cab, _), corpo in zip(docs, corpos)]
+    final = "".join(partes)
+    relatorio["tokens_finais"] = sum(d["tokens_finais"] for d in relatorio["documentos"])
+    relatorio["ajustado"] = True
+    return final, relatorio
@@ -0,0 +1,63 @@
+"""
+rasterizador.py
+----------------
+Rasterização de PDFs em streaming, com memória limitada.
+
+Em vez de convert_from_path(path, dpi=300) — que materializa TODAS as páginas como imagens
+PIL de uma vez (um contrato escaneado de 100 páginas ocupa vários GB) — as páginas são
+convertidas em janelas pequenas (first_page/last_page) e entregues uma a uma por um gerador.
+O pico de memória passa a depender apenas do tamanho da janela, não do tamanho do documento.
+
+Variáveis de ambiente:
+- RASTER_JANELA_PAGINAS: páginas rasterizadas por chamada ao poppler (padrão: 2)
+"""
+
+import os
+from typing import Iterable, Iterator, Optional, Tuple
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+RASTER_JANELA_PAGINAS = max(1, int(os.getenv("RASTER_JANELA_PAGINAS", "2")))
+_EXTENSOES_IMAGEM = (".png", ".jpg", ".jpeg", ".tiff", ".bmp")
+
+
+def contar_paginas(path_pdf: str) -> int:
+    """Número de páginas do PDF (pdfinfo, sem rasterizar)."""
+    return int(pdfinfo_from_path(path_pdf).get("Pages", 0))
+
+
+def rasterizar_pagina(path_pdf: str, pagina: int, dpi: int = 300) -> Optional[Image.Image]:
+    """Rasteriza uma única página (1-based)."""
+    imagens = convert_from_path(path_pdf, dpi=dpi, first_page=pagina, last_page=pagina)
+    return imagens[0] if imagens else None
+
+
+def iterar_paginas(
+    path_pdf: str,
+    dpi: int = 300,
+    janela: int = RASTER_JANELA_PAGINAS,
+    paginas: Optional[Iterable[int]] = None,
+) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Gera (numero_pagina, imagem) em ordem, rasterizando no máximo `janela` páginas por vez.
+    Arquivos de imagem (png/jpg/...) são entregues diretamente como página 1.
+    """
+    if path_pdf.lower().endswith(_EXTENSOES_IMAGEM):
+        with Image.open(path_pdf) as img:
+            yield 1, img.convert("RGB")
+        return
+
+    alvo = sorted(set(paginas)) if paginas is not None else list(range(1, contar_paginas(path_pdf) + 1))
+    i = 0
+    while i < len(alvo):
+        # Agrupa páginas consecutivas (até o tamanho da janela) em uma única chamada ao poppler
+        inicio = fim = alvo[i]
+        while i + 1 < len(alvo) and alvo[i + 1] == fim + 1 and fim - inicio + 1 < janela:
+            i += 1
+            fim = alvo[i]
+        i += 1
+        lote = convert_from_path(path_pdf, dpi=dpi, first_page=inicio, last_page=fim)
+        for offset, img in enumerate(lote):
+            yield inicio + offset, img
+        del lote
@@ -0,0 +1,275 @@
+"""
+receitaws_fake.py
+------------------
+Servidor local que imita a ReceitaWS para testes de carga offline (sem gastar a cota real).
+
+Fluxo:
+1. Carrega as respostas gravadas em outbox/*/serpro/*_saida_receitaws_*.json (a mais recente por CNPJ)
+2. Atende GET /v1/cnpj/<cnpj>[?token=...] como a API real; CNPJ sem fixture recebe uma cópia
+   sintética (ou status ERROR, com --desconhecido erro)
+3. Injeta falhas sob demanda: latência, HTTP 429 com Retry-After, {"status": "ERROR"} de limite,
+   respostas que não chegam antes do timeout do cliente e cota por minuto como a do plano
+4. GET /_stats devolve os contadores do servidor
+
+Uso:
+    python receitaws_fake.py --porta 8765 --latencia-ms 300 --taxa-429 0.1 --rpm 60
+    RECEITAWS_BASE_URL=http://127.0.0.1:8765/v1/cnpj/ python main.py
+
+Benchmark da camada de consulta (consulta_serpro: pool HTTP, agendador, retries) contra o servidor:
+    RECEITAWS_RPM=600 python receitaws_fake.py --benchmark 200 --threads 16 --taxa-erro 0.05
+"""
+
+import argparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from log_service import get_logger, init_folders
+
+LOGGER = get_logger("receitaws_fake")
+DIRS = init_folders()
+
+_RE_ROTA = re.compile(r"^/v1/cnpj/(\d{14})/?$")
+
+
+def _digitos(v: Any) -> str:
+    return re.sub(r"\D", "", "" if v is None else str(v))
+
+
+def _formatar_cnpj(d: str) -> str:
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+
+
+def carregar_fixtures(outbox_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """{cnpj (14 dígitos): resposta} a partir das evidências de saída gravadas pelo consulta_serpro."""
+    fixtures: Dict[str, Dict[str, Any]] = {}
+    # O nome termina em <YYYYmmdd_HHMMSS>: ordenar pelo nome faz a mais recente sobrescrever as anteriores
+    for path in sorted(Path(outbox_dir).glob("*/serpro/*_saida_receitaws_*.json"), key=lambda p: p.name[-20:]):
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f"Fixture ignorada ({path.name}): {e}")
+            continue
+        cnpj = _digitos(dados.get("cnpj")) if isinstance(dados, dict) else ""
+        if len(cnpj) == 14 and dados.get("status") != "ERROR":
+            fixtures[cnpj] = dados
+    return fixtures
+
+
+# =====================================================
+# 🔹 Servidor
+# =====================================================
+
+class _Estado:
+    """Configuração de falhas + contadores compartilhados entre as threads do servidor."""
+
+    def __init__(self, fixtures: Dict[str, Dict[str, Any]], args: argparse.Namespace):
+        self.fixtures = fixtures
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.janela: list = []  # instantes das requisições no último minuto (cota --rpm)
+        self.stats: Counter = Counter()
+
+    def sortear(self, taxa: float) -> bool:
+        with self.lock:
+            return taxa > 0 and self.random.random() < taxa
+
+    def latencia(self) -> float:
+        with self.lock:
+            ms = self.args.latencia_ms + self.random.uniform(-self.args.jitter_ms, self.args.jitter_ms)
+        return max(0.0, ms) / 1000
+
+    def excedeu_cota(self) -> bool:
+        if not self.args.rpm:
+            return False
+        agora = time.monotonic()
+        with self.lock:
+            self.janela = [t for t in self.janela if agora - t < 60]
+            if len(self.janela) >= self.args.rpm:
+                return True
+            self.janela.append(agora)
+            return False
+
+    def resposta_para(self, cnpj: str) -> Optional[Dict[str, Any]]:
+        if cnpj in self.fixtures:
+            return self.fixtures[cnpj]
+        if self.args.desconhecido == "erro" or not self.fixtures:
+            return None
+        with self.lock:
+            base = self.fixtures[self.random.choice(sorted(self.fixtures))]
+        sintetica = copy.deepcopy(base)
+        sintetica["cnpj"] = _formatar_cnpj(cnpj)
+        return sintetica
+
+    def contar(self, evento: str) -> None:
+        with self.lock:
+            self.stats[evento] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ReceitaWSFake/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive, como a API real (exercita o pool do cliente)
+    estado: _Estado  # atribuído em criar_servidor
+
+    def log_message(self, fmt, *args):  # silencia o log padrão por requisição
+        LOGGER.debug("%s - %s" % (self.address_string(), fmt % args))
+
+    def _responder(self, status: int, corpo: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        bruto = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(bruto)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(bruto)
+        except (BrokenPipeError, ConnectionResetError):
+            self.estado.contar("cliente_desconectou")
+
+    def do_GET(self):
+        estado = self.estado
+        caminho = self.path.split("?", 1)[0]
+        if caminho == "/_stats":
+            with estado.lock:
+                stats = dict(estado.stats)
+            return self._responder(200, {"fixtures": len(estado.fixtures), **stats})
+
+        m = _RE_ROTA.match(caminho)
+        if not m:
+            estado.contar("rota_invalida")
+            return self._responder(404, {"status": "ERROR", "message": "Rota não encontrada"})
+        cnpj = m.group(1)
+        estado.contar("requisicoes")
+        args = estado.args
+
+        if estado.excedeu_cota() or estado.sortear(args.taxa_429):
+            estado.contar("http_429")
+            return self._responder(429, {"status": "ERROR", "message": "Too many requests"}, {"Retry-After": str(args.retry_after)})
+        if estado.sortear(args.taxa_timeout):
+            estado.contar("timeout")
+            time.sleep(args.timeout_s)
+        else:
+            time.sleep(estado.latencia())
+        if estado.sortear(args.taxa_erro):
+            estado.contar("status_error")
+            return self._responder(200, {
+                "status": "ERROR",
+                "message": f"Limite de consultas atingido. Pode realizar nova consulta em {args.retry_after} segundos.",
+            })
+
+        dados = estado.resposta_para(cnpj)
+        if dados is None:
+            estado.contar("cnpj_desconhecido")
+            return self._responder(200, {"status": "ERROR", "message": "CNPJ inválido"})
+        estado.contar("ok")
+        return self._responder(200, dados)
+
+
+def criar_servidor(args: argparse.Namespace) -> Tuple[ThreadingHTTPServer, _Estado]:
+    """Servidor pronto para serve_forever() (também usado pelo modo --benchmark, em thread)."""
+    fixtures = carregar_fixtures(Path(args.outbox))
+    estado = _Estado(fixtures, args)
+    handler = type("_HandlerConfigurado", (_Handler,), {"estado": estado})
+    servidor = ThreadingHTTPServer((args.host, args.porta), handler)
+    servidor.daemon_threads = True
+    LOGGER.info(f"ReceitaWS fake em http://{args.host}:{servidor.server_address[1]}/v1/cnpj/ — {len(fixtures)} fixture(s).")
+    return servidor, estado
+
+
+# =====================================================
+# 🔹 Benchmark da camada de consulta
+# =====================================================
+
+def executar_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Sobe o servidor em thread e dispara `args.benchmark` consultas por `args.threads` workers
+    através de consulta_serpro (sem cache nem evidências: mede pool HTTP, agendador, retries e o
+    single-flight — CNPJs repetidos simultâneos compartilham a mesma requisição).
+    """
+    import os
+    servidor, estado = criar_servidor(args)
+    threading.Thread(target=servidor.serve_forever, name="receitaws-fake", daemon=True).start()
+    os.environ["RECEITAWS_BASE_URL"] = f"http://{args.host}:{servidor.server_address[1]}/v1/cnpj/"
+    os.environ.setdefault("RECEITAWS_TIMEOUT", str(max(1.0, args.timeout_s / 2)))
+
+    import consulta_serpro
+    from despachante_receitaws import coalescer, metricas
+
+    base = sorted(estado.fixtures) or ["22157088000192"]
+    cnpjs = [base[i % len(base)] if i < args.repetidos else f"{i:014d}" for i in range(args.benchmark)]
+
+    def _uma(cnpj: str) -> Tuple[str, bool, float]:
+        inicio = time.perf_counter()
+        res, compartilhada = coalescer(cnpj, lambda: consulta_serpro._buscar_receitaws(cnpj, consulta_serpro._montar_url(cnpj)))
+        return res.get("status", "ERRO"), compartilhada, time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix="bench") as pool:
+        resultados = list(pool.map(_uma, cnpjs))
+    total = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    latencias = sorted(t for _, _, t in resultados)
+    resumo = {
+        "consultas": len(resultados),
+        "duracao_s": round(total, 3),
+        "vazao_por_s": round(len(resultados) / total, 2) if total else 0.0,
+        "latencia_p50_s": round(latencias[len(latencias) // 2], 3) if latencias else 0.0,
+        "latencia_p95_s": round(latencias[int(len(latencias) * 0.95) - 1], 3) if latencias else 0.0,
+        "status": dict(Counter(s for s, _, _ in resultados)),
+        "compartilhadas": sum(1 for _, c, _ in resultados if c),
+        "servidor": dict(estado.stats),
+        "agendador": metricas(),
+    }
+    print(json.dumps(resumo, ensure_ascii=False, indent=2))
+    return resumo
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ReceitaWS fake (fixtures de outbox/*/serpro) para testes de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta (0 = livre)")
+    parser.add_argument("--outbox", default=DIRS["OUTBOX_DIR"], help="Pasta com as evidências <job>/serpro/*_saida_receitaws_*.json")
+    parser.add_argument("--desconhecido", choices=("sintetico", "erro"), default="sintetico",
+                        help="CNPJ sem fixture: cópia sintética de outra fixture ou status ERROR")
+    parser.add_argument("--latencia-ms", type=float, default=200.0, help="Latência média por resposta")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Variação (±) da latência")
+    parser.add_argument("--rpm", type=int, default=0, help="Cota por minuto como a do plano (excedente → 429); 0 = sem cota")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração de respostas HTTP 429")
+    parser.add_argument("--retry-after", type=int, default=2, help="Segundos sugeridos nos 429/status ERROR")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help='Fração de respostas {"status": "ERROR"} (limite)')
+    parser.add_argument("--taxa-timeout", type=float, default=0.0, help="Fração de respostas atrasadas além do timeout")
+    parser.add_argument("--timeout-s", type=float, default=30.0, help="Atraso das respostas de timeout")
+    parser.add_argument("--seed", type=int, default=None, help="Semente das falhas sorteadas (reprodutível)")
+    parser.add_argument("--benchmark", type=int, default=0, help="Executa N consultas via consulta_serpro e sai")
+    parser.add_argument("--threads", type=int, default=8, help="Workers do benchmark")
+    parser.add_argument("--repetidos", type=int, default=0,
+                        help="Quantas consultas do benchmark usam CNPJs das fixtures (repetidos → single-flight)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        if args.porta == 8765:
+            args.porta = 0
+        executar_benchmark(args)
+    else:
+        servidor, _ = criar_servidor(args)
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            LOGGER.info("ReceitaWS fake encerrado.")
+        finally:
+            servidor.server_close()
@@ -0,0 +1,246 @@
+"""
+regras_deterministicas.py
+--------------------------
+Regras locais (sem LLM) executadas entre OCR/ReceitaWS e a IA Validador 2.
+
+Verificações mecânicas que os prompts PF/PJ pedem ao modelo:
+1. Dígitos verificadores do CNPJ do manifest e dos CPFs encontrados no OCR; no OCR, só conta como
+   CNPJ a sequência de 14 dígitos cujo DV confere (evita códigos de barras, protocolos etc.)
+2. Validade da CNH (data "VALIDADE" do OCR ou, na falta, a data mais futura encontrada) vs hoje
+3. Situação cadastral na ReceitaWS ("ATIVA")
+4. Razão social da ReceitaWS presente no texto dos documentos
+
+Os resultados entram como fatos estruturados na entrada da IA2 ("fatos_deterministicos").
+Quando um critério crítico já está decidido (ex.: CNPJ BAIXADO/INAPTO ou com DV inválido), a IA2
+pode ser dispensada: `resultado_por_regras` devolve o ia2_result no mesmo formato do agente OpenAI.
+A situação cadastral só decide sozinha com dados atuais da ReceitaWS (API ou cache válido); com cache
+expirado (API indisponível) o achado segue como fato para a IA2.
+
+Variáveis de ambiente:
+- REGRAS_CURTO_CIRCUITO: dispensa a IA2 quando as regras já decidem IMPEDITIVO (padrão: true)
+"""
+
+import json
+import os
+import re
+import unicodedata
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from log_service import get_logger, init_folders, safe_mkdir
+
+LOGGER = get_logger("regras_deterministicas")
+DIRS = init_folders()
+
+REGRAS_CURTO_CIRCUITO = os.getenv("REGRAS_CURTO_CIRCUITO", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+_SITUACOES_IMPEDITIVAS = {"BAIXADA", "INAPTA", "SUSPENSA", "NULA"}
+_RE_CNPJ = re.compile(r"\b\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}\b")
+_RE_CPF = re.compile(r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b")
+_RE_DATA = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+_RE_VALIDADE = re.compile(r"VALIDADE\D{0,20}(\d{2}/\d{2}/\d{4})", re.IGNORECASE)
+_SUFIXOS_SOCIETARIOS = re.compile(r"\b(LTDA|ME|EPP|EIRELI|S ?A|S/A|MEI)\b\.?$")
+
+
+# =====================================================
+# 🔹 Validadores
+# =====================================================
+
+def _digitos(v: Any) -> str:
+    return re.sub(r"\D", "", "" if v is None else str(v))
+
+
+def cnpj_valido(cnpj: str) -> bool:
+    """Confere os dois dígitos verificadores do CNPJ (módulo 11)."""
+    d = _digitos(cnpj)
+    if len(d) != 14 or d == d[0] * 14:
+        return False
+    for tamanho in (12, 13):
+        pesos = list(range(tamanho - 7, 1, -1)) + list(range(9, 1, -1))
+        soma = sum(int(n) * p for n, p in zip(d[:tamanho], pesos))
+        dv = 0 if soma % 11 < 2 else 11 - soma % 11
+        if int(d[tamanho]) != dv:
+            return False
+    return True
+
+
+def cpf_valido(cpf: str) -> bool:
+    """Confere os dois dígitos verificadores do CPF (módulo 11)."""
+    d = _digitos(cpf)
+    if len(d) != 11 or d == d[0] * 11:
+        return False
+    for tamanho in (9, 10):
+        soma = sum(int(n) * p for n, p in zip(d[:tamanho], range(tamanho + 1, 1, -1)))
+        dv = (soma * 10) % 11 % 10
+        if int(d[tamanho]) != dv:
+            return False
+    return True
+
+
+def _normalizar_nome(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii").upper()
+    return re.sub(r"\s+", " ", re.sub(r"[^A-Z0-9/ ]", " ", texto)).strip()
+
+
+def _parse_data(texto: str) -> Optional[date]:
+    try:
+        return datetime.strptime(texto, "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+
+# =====================================================
+# 🔹 Regras
+# =====================================================
+
+def _regra_cnpj_manifest(cnpj: str) -> Dict[str, Any]:
+    if not cnpj:
+        return {"cnpj": None, "valido": None, "observacao": "CNPJ não informado no manifest."}
+    return {"cnpj": cnpj, "valido": cnpj_valido(cnpj)}
+
+
+def _regra_documentos_ocr(texto: str, cnpj_manifest: str) -> Dict[str, Any]:
+    cnpjs = sorted({d for d in (_digitos(m) for m in _RE_CNPJ.findall(texto)) if cnpj_valido(d)})
+    cpfs = sorted({_digitos(m) for m in _RE_CPF.findall(texto)})
+    return {
+        "cnpjs": [{"cnpj": c, "igual_manifest": c == cnpj_manifest} for c in cnpjs],
+        "cpfs": [{"cpf": c, "valido": cpf_valido(c)} for c in cpfs],
+        "cnpj_manifest_encontrado": bool(cnpj_manifest) and cnpj_manifest in cnpjs,
+    }
+
+
+def _regra_cnh(ocr_result: Dict[str, Any], hoje: date) -> List[Dict[str, Any]]:
+    resultados = []
+    for arq in ocr_result.get("arquivos", []):
+        if arq.get("metodo") != "CNH_OCR":
+            continue
+        meta = arq.get("cnh_metadata") or {}
+        texto = ""
+        try:
+            with open(arq.get("evidencia", ""), "r", encoding="utf-8") as f:
+                texto = f.read()
+        except OSError:
+            pass
+        m = _RE_VALIDADE.search(texto)
+        validade = _parse_data(m.group(1)) if m else None
+        origem = "campo VALIDADE"
+        if validade is None:
+            datas = [d for d in (_parse_data(x) for x in meta.get("datas_encontradas") or []) if d]
+            validade = max(datas) if datas else None
+            origem = "data mais futura do documento"
+        cpf = meta.get("cpf")
+        resultados.append({
+            "arquivo": arq.get("arquivo"),
+            "cpf": _digitos(cpf) or None,
+            "cpf_valido": cpf_valido(cpf) if cpf else None,
+            "validade": validade.strftime("%d/%m/%Y") if validade else None,
+            "validade_origem": origem if validade else None,
+            "vigente": (validade >= hoje) if validade else None,
+        })
+    return resultados
+
+
+def _regra_receita(serpro_result: Dict[str, Any], texto: str) -> Dict[str, Any]:
+    dados = serpro_result.get("dados") or {}
+    if serpro_result.get("status") != "OK" or not dados:
+        return {"consultada": False, "status_consulta": serpro_result.get("status")}
+    situacao = (dados.get("situacao") or "").strip().upper()
+    nome = dados.get("nome") or ""
+    texto_norm = _normalizar_nome(texto)
+    nome_norm = _normalizar_nome(nome)
+    nome_base = _SUFIXOS_SOCIETARIOS.sub("", nome_norm).strip()
+    return {
+        "consultada": True,
+        # Cache vencido devolvido porque a API falhou: o dado pode estar desatualizado
+        "dados_expirados": (serpro_result.get("cache") or {}).get("origem") == "CACHE_EXPIRADO",
+        "situacao": situacao,
+        "ativa": situacao == "ATIVA",
+        "data_situacao": dados.get("data_situacao"),
+        "razao_social": nome,
+        "razao_social_no_ocr": bool(nome_norm) and (nome_norm in texto_norm or (len(nome_base) >= 5 and nome_base in texto_norm)),
+    }
+
+
+def _decidir(perfil: str, fatos: Dict[str, Any]) -> Dict[str, Any]:
+    """Critérios críticos já decididos pelas regras (lista vazia ⇒ a IA2 decide)."""
+    motivos, acoes = [], []
+    cnpj = fatos["cnpj_manifest"]
+    if perfil == "PJ" and cnpj["valido"] is False:
+        motivos.append(f"CNPJ informado ({cnpj['cnpj']}) com dígitos verificadores inválidos.")
+        acoes.append("Corrigir o CNPJ informado no cadastro do fornecedor.")
+    receita = fatos["receita"]
+    # Reprovação definitiva só com dados atuais; com cache expirado a IA2 pondera o achado
+    if perfil == "PJ" and receita.get("consultada") and not receita["dados_expirados"] and receita["situacao"] in _SITUACOES_IMPEDITIVAS:
+        motivos.append(f"Situação cadastral na Receita Federal: {receita['situacao']} (desde {receita.get('data_situacao') or 'n/d'}).")
+        acoes.append("Regularizar a situação cadastral do CNPJ junto à Receita Federal.")
+    return {"status_global": "IMPEDITIVO" if motivos else None, "motivos": motivos, "acoes_recomendadas": acoes}
+
+
+# =====================================================
+# 🔹 API pública
+# =====================================================
+
+def avaliar_regras(manifest: Dict[str, Any], ocr_result: Dict[str, Any], serpro_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa todas as regras e devolve os fatos estruturados + decisão (se houver)."""
+    perfil = manifest.get("perfil_validacao") or manifest.get("tipo") or "PJ"
+    texto = ocr_result.get("dados_extraidos", "") or ""
+    cnpj_manifest = _digitos(serpro_result.get("cnpj")) or _digitos(manifest.get("fornecedor_id"))
+    if len(cnpj_manifest) != 14:
+        cnpj_manifest = ""
+    fatos: Dict[str, Any] = {
+        "data_referencia": date.today().strftime("%d/%m/%Y"),
+        "cnpj_manifest": _regra_cnpj_manifest(cnpj_manifest),
+        "documentos_ocr": _regra_documentos_ocr(texto, cnpj_manifest),
+        "cnh": _regra_cnh(ocr_result, date.today()),
+        "receita": _regra_receita(serpro_result, texto),
+    }
+    fatos["decisao"] = _decidir(perfil, fatos)
+    return fatos
+
+
+def dispensa_ia2(fatos: Dict[str, Any]) -> bool:
+    return REGRAS_CURTO_CIRCUITO and fatos["decisao"]["status_global"] == "IMPEDITIVO"
+
+
+def salvar_fatos(job_id: str, fatos: Dict[str, Any]) -> Path:
+    """Grava os fatos em outbox/<job_id>/ia/<job_id>_fatos_regras_<ts>.json."""
+    evid_dir = safe_mkdir(Path(DIRS["OUTBOX_DIR"]) / job_id / "ia")
+    path = evid_dir / f"{job_id}_fatos_regras_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fatos, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def resultado_por_regras(job_id: str, manifest: Dict[str, Any], fatos: Dict[str, Any], evidencia: Path) -> Dict[str, Any]:
+    """ia2_result sintetizado (mesmo formato de validar_documentos_openai) quando a IA2 é dispensada."""
+    decisao = fatos["decisao"]
+    nome = fatos["receita"].get("razao_social") or manifest.get("fornecedor_id", "")
+    resultado = {
+        "empresa": nome,
+        "regras_disparadas": decisao["motivos"],
+        "decisao_final": {
+            "status_global": decisao["status_global"],
+            "justificativa": " ".join(decisao["motivos"]),
+            "acoes_recomendadas": decisao["acoes_recomendadas"],
+        },
+        "email_sugerido": {
+            "assunto": f"[Licitanet] — Documentação com impeditivo ({nome})",
+            "corpo": "Prezado fornecedor,\n\nA validação não pôde ser concluída devido a impeditivo(s):\n"
+                     + "\n".join(f"- {m}" for m in decisao["motivos"])
+                     + "\n\nPróximas ações:\n" + "\n".join(f"- {a}" for a in decisao["acoes_recomendadas"]),
+        },
+    }
+    LOGGER.bind(job_id=job_id, etapa="IA", evento="REGRAS").info(
+        f"IA2 dispensada: critérios críticos decididos pelas regras ({decisao['status_global']})."
+    )
+    return {
+        "status": "OK",
+        "job_id": job_id,
+        "modo": "comparativo",
+        "origem": "REGRAS_DETERMINISTICAS",
+        "resultado": resultado,
+        "resposta_bruta": json.dumps(resultado, ensure_ascii=False),
+        "data_execucao": datetime.now().isoformat(),
+        "arquivos_evidencia": {"entrada": str(evidencia), "saida": str(evidencia)},
+    }
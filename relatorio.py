@@ -108,6 +108,11 @@ def gerar_resumo_executivo(manifest, ocr_result, ia1_result, serpro_result, ia2_
     tipo = manifest.get("tipo", "PJ")
     cnpj = manifest.get("cnpj", "Não informado")
     data = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    cache = serpro_result.get("cache") or {}
+    origem_receita = ""
+    if cache.get("origem") in ("CACHE", "CACHE_EXPIRADO"):
+        expirado = ", expirado — API indisponível" if cache["origem"] == "CACHE_EXPIRADO" else ""
+        origem_receita = f" (dados em cache de {cache.get('consultado_em')}, idade {cache.get('idade_segundos', 0) / 3600:.1f}h{expirado})"
 
     resumo = f"""# Resumo Executivo — Verificação Documental ({tipo})
 
@@ -118,7 +123,7 @@ def gerar_resumo_executivo(manifest, ocr_result, ia1_result, serpro_result, ia2_
 ## Resultado Geral
 - OCR: {ocr_result.get('status')}
 - IA Validação 1: {ia1_result.get('status')}
-- Consulta SERPRO: {serpro_result.get('status')}
+- Consulta SERPRO: {serpro_result.get('status')}{origem_receita}
 - IA Validação 2 (Final): {ia2_result.get('status')}
 
 ## Observações Gerais
@@ -4,12 +4,11 @@
 
 import os
 import json
-import time
 from pathlib import Path
 from typing import Any, Dict, Optional
-from openai import OpenAI
 from log_service import get_logger, safe_mkdir
-from env_loader import get_client, get_model
+from env_loader import get_model
+from despachante_openai import executar_chat
 
 logger = get_logger(__name__)
 
@@ -72,30 +71,27 @@ def build_prompt(manifest: Dict[str, Any], extracted_text: str) -> str:
 
 def call_openai(prompt: str, model: str = MODEL_DEFAULT, retries: int = MAX_RETRIES) -> str:
     """
-    Chama a API OpenAI com retries automáticos e logs detalhados.
+    Chama a API OpenAI pelo despachante central (rate limit RPM/TPM compartilhado,
+    Retry-After e backoff com jitter) e logs detalhados.
     """
-    for attempt in range(1, retries + 1):
-        try:
-            logger.info(f"Enviando prompt ao OpenAI (tentativa {attempt}/{retries})")
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "Você é um agente especialista em validação documental."},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.2,
-                max_tokens=4000,
-            )
-            content = response.choices[0].message.content
-            used = getattr(getattr(response, "usage", None), "total_tokens", "n/d")
-            logger.info(f"Resposta recebida com sucesso (tokens={used})")
-            return content
-        except Exception as e:
-            logger.warning(f"Erro na chamada OpenAI (tentativa {attempt}): {e}")
-            if attempt < retries:
-                time.sleep(2 * attempt)
-            else:
-                raise RuntimeError(f"Falha após {retries} tentativas: {e}")
+    try:
+        logger.info(f"Enviando prompt ao OpenAI (até {retries} tentativas)")
+        response = executar_chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": "Você é um agente especialista em validação documental."},
+                {"role": "user", "content": prompt},
+            ],
+            tentativas=retries,
+            temperature=0.2,
+            max_tokens=4000,
+        )
+        content = response.choices[0].message.content
+        used = getattr(getattr(response, "usage", None), "total_tokens", "n/d")
+        logger.info(f"Resposta recebida com sucesso (tokens={used})")
+        return content
+    except Exception as e:
+        raise RuntimeError(f"Falha após {retries} tentativas: {e}")
 
 
 def parse_response_to_json(response_text: str) -> Dict[str, Any]:
@@ -0,0 +1,91 @@
+# test_lease.py
+# Disputa entre a renovação atrasada do dono (heartbeat) e a tomada de posse do lease expirado
+# por outro nó: ao final, no máximo um nó pode se considerar dono, e é ele que está no arquivo.
+# Cada "nó" é um processo separado (OWNER_ID próprio) sobre o mesmo diretório de processing.
+# Uso:  python -m pytest -q test_lease.py   (ou: python test_lease.py)
+
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RODADAS = 40
+
+
+def _preparar_ambiente(base: Path) -> None:
+    for var, pasta in (("PATH_PROCESSING", "processing"), ("PATH_INBOX", "inbox"), ("PATH_OUTBOX", "outbox"),
+                       ("PATH_DONE", "done"), ("PATH_ERROR", "error"), ("PATH_EVIDENCIAS", "evidencias"),
+                       ("PATH_LOGS", "logs"), ("PATH_CACHE", "cache")):
+        os.environ[var] = str(base / pasta)
+    os.environ["LEASE_TTL_SECONDS"] = "60"
+
+
+def _no_dono(jobs, barreira, resultados) -> None:
+    """Nó A: adquire o lease, simula heartbeat atrasado (lease vencido) e tenta renovar."""
+    import lease
+    for job_id in jobs:
+        assert lease.adquirir_lease(job_id)
+        path = lease._lease_path(job_id)
+        registro = json.loads(path.read_text(encoding="utf-8"))
+        registro["expira_em"] = time.time() - 1
+        path.write_text(json.dumps(registro), encoding="utf-8")
+        barreira.wait()
+        resultados.put((job_id, "A", lease.OWNER_ID, lease.renovar_lease(job_id)))
+
+
+def _no_concorrente(jobs, barreira, resultados) -> None:
+    """Nó B: assume o lease expirado assim que o nó A começa a renovar."""
+    import lease
+    for job_id in jobs:
+        barreira.wait()
+        resultados.put((job_id, "B", lease.OWNER_ID, lease.adquirir_lease(job_id)))
+
+
+def _disputar(base: Path) -> list:
+    _preparar_ambiente(base)
+    ctx = multiprocessing.get_context("spawn")
+    jobs = [f"job_corrida_{i:03d}" for i in range(RODADAS)]
+    barreira = ctx.Barrier(2)
+    resultados = ctx.Queue()
+    nos = [ctx.Process(target=f, args=(jobs, barreira, resultados)) for f in (_no_dono, _no_concorrente)]
+    for p in nos:
+        p.start()
+    brutos = [resultados.get(timeout=60) for _ in range(2 * RODADAS)]
+    for p in nos:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    leases_dir = base / "processing" / ".leases"
+    falhas = []
+    for job_id in jobs:
+        por_no = {no: (dono, ok) for jid, no, dono, ok in brutos if jid == job_id}
+        vencedores = [dono for dono, ok in por_no.values() if ok]
+        arquivo = json.loads((leases_dir / f"{job_id}.lease").read_text(encoding="utf-8"))
+        if len(vencedores) > 1:
+            falhas.append(f"{job_id}: dois donos ({vencedores})")
+        elif vencedores and arquivo.get("dono") != vencedores[0]:
+            falhas.append(f"{job_id}: {vencedores[0]} se considera dono, mas o lease é de {arquivo.get('dono')}")
+    assert not list(leases_dir.glob("*.renovando.*")), "sobrou arquivo de renovação"
+    return falhas
+
+
+def test_renovacao_atrasada_nao_sobrescreve_tomada_de_posse(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # logs de fallback relativos ficam no diretório temporário
+    for var in ("PATH_PROCESSING", "PATH_INBOX", "PATH_OUTBOX", "PATH_DONE", "PATH_ERROR",
+                "PATH_EVIDENCIAS", "PATH_LOGS", "PATH_CACHE", "LEASE_TTL_SECONDS"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.syspath_prepend(str(Path(__file__).resolve().parent))
+    falhas = _disputar(tmp_path)
+    assert not falhas, "\n".join(falhas)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        falhas = _disputar(Path(tmp))
+    print("\n".join(falhas) or f"OK — {RODADAS} disputas, nunca dois donos.")
+    sys.exit(1 if falhas else 0)
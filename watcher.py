@@ -5,16 +5,41 @@ from __future__ import annotations
 import os
 import time
 import json
+import queue
 import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List, Dict, Any, Iterable
+from typing import List, Dict, Any, Iterable, Optional
 
 from log_service import get_logger, init_folders, registrar_evento, safe_mkdir
 from manifest_loader import load_manifest
 from ocr_router import executar_ocr
-from doc_verifier_agent import validar_documentos_openai
-from consulta_serpro import consultar_cnpj
+from extrator_docling import DOCLING_PRELOAD, aquecer_docling
+from doc_verifier_agent import fingerprint_validacao, validar_documentos_openai
+from consulta_serpro import consultar_cnpj_em_segundo_plano, pre_buscar_cnpj_do_manifest
 from relatorio import gerar_relatorio_final
+from entrada_comparativa import montar_entrada_comparativa
+from regras_deterministicas import avaliar_regras, dispensa_ia2, resultado_por_regras, salvar_fatos
+from checkpoint import (
+    calcular_fingerprint,
+    carregar_checkpoint,
+    fingerprint_entrada_job,
+    limpar_checkpoints,
+    listar_jobs_orfaos,
+    salvar_checkpoint,
+)
+from lease import LeasePerdido, adquirir_lease, lease_disponivel, liberar_lease, verificar_lease
+from ledger import register_entry, should_reprocess
+
+# Detecção por eventos (opcional): se watchdog não estiver disponível, cai para polling
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    FileSystemEventHandler = object  # type: ignore[misc,assignment]
 
 LOGGER = get_logger("watcher")
 LOGGER.info(f"watcher.py carregado de: {__file__}")
@@ -23,6 +48,14 @@ DIRS = init_folders()
 
 SLEEP_INTERVAL = int(os.getenv("WATCHER_SLEEP_SECONDS", "5"))
 WAIT_STABILITY_SECONDS = int(os.getenv("WAIT_STABILITY_SECONDS", "5"))  # .env.txt já sugere 5
+MAX_PARALLEL_JOBS = max(1, int(os.getenv("WATCHER_MAX_PARALLEL_JOBS", "2")))
+WATCHER_MODE = os.getenv("WATCHER_MODE", "eventos").strip().lower()  # eventos | polling
+RECONCILE_INTERVAL = int(os.getenv("WATCHER_RECONCILE_SECONDS", "60"))  # varredura de segurança no modo eventos
+
+# Pool de execução de jobs + controle de jobs em andamento (evita despacho duplicado)
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_JOBS_EM_ANDAMENTO: Dict[str, Future] = {}
+_JOBS_LOCK = threading.Lock()
 
 # -----------------------------------------------------------------------------
 # Utils de detecção/movimentação
@@ -47,11 +80,29 @@ def _is_upload_in_progress(job_dir: Path) -> bool:
             return True
     return False
 
+def _upload_estavel(job_dir: Path) -> bool:
+    """
+    manifest.json presente, sem *.part e nenhum arquivo alterado nos últimos WAIT_STABILITY_SECONDS
+    (cobre o manifest ainda sendo gravado e PDFs copiados depois dele sem .part).
+    """
+    if not (job_dir / "manifest.json").exists() or _is_upload_in_progress(job_dir):
+        return False
+    limite = time.time() - WAIT_STABILITY_SECONDS
+    try:
+        return all(item.stat().st_mtime <= limite for item in job_dir.rglob("*") if item.is_file())
+    except FileNotFoundError:  # arquivo renomeado/removido durante a varredura: ainda mudando
+        return False
+
 def _move_job_to_processing(inbox_job_dir: Path) -> Path:
-    """Move /inbox/.../<job_id>/ para /processing/<job_id>/ (rename atômico)."""
+    """
+    Move /inbox/.../<job_id>/ para /processing/<job_id>/ (rename atômico).
+    Deve ser chamado somente com o lease do job em mãos: um destino pré-existente é então
+    resíduo de uma execução anterior deste job_id, e não trabalho de outro nó.
+    """
     job_id = inbox_job_dir.name
     dest = Path(DIRS["PROCESSING_DIR"]) / job_id
     if dest.exists():
+        LOGGER.warning(f"[{job_id}] Resíduo de execução anterior em processing — substituindo.")
         shutil.rmtree(dest)
     safe_mkdir(dest.parent)
     # move a pasta do job inteira
@@ -108,10 +159,90 @@ def process_job(inbox_job_dir: Path):
             LOGGER.warning(f"[{job_id}] Upload ainda não estabilizado. Pular nesta iteração.")
             return
 
-    # Move para /processing/<job_id>/
-    processing_dir = _move_job_to_processing(inbox_job_dir)
-    registrar_evento("WATCHER", f"Job movido para processing: {processing_dir.as_posix()}", job_id=job_id)
+    # Posse do job (vários containers podem ler o mesmo /inbox)
+    if not adquirir_lease(job_id):
+        LOGGER.info(f"[{job_id}] Job já reivindicado por outro nó.")
+        return
+    if not (inbox_job_dir / "manifest.json").exists():
+        # Outro nó concluiu o job entre a varredura e a aquisição do lease
+        liberar_lease(job_id)
+        return
 
+    try:
+        # Move para /processing/<job_id>/
+        processing_dir = _move_job_to_processing(inbox_job_dir)
+        registrar_evento("WATCHER", f"Job movido para processing: {processing_dir.as_posix()}", job_id=job_id)
+
+        # Execução nova: as etapas reaproveitam a saída anterior quando o fingerprint bate,
+        # exceto as forçadas pelo reprocess_scope do manifest
+        _executar_pipeline(job_id, processing_dir, nova_execucao=True)
+    finally:
+        liberar_lease(job_id)
+
+
+def retomar_job(processing_dir: Path):
+    """Retoma um job órfão em /processing a partir da última etapa concluída (checkpoints)."""
+    job_id = processing_dir.name
+    if not adquirir_lease(job_id):
+        return
+    try:
+        if not (processing_dir / "manifest.json").exists():
+            return
+        registrar_evento("WATCHER", f"Retomando job órfão em processing: {processing_dir.as_posix()}", job_id=job_id)
+        _executar_pipeline(job_id, processing_dir)
+    finally:
+        liberar_lease(job_id)
+
+
+# Etapas refeitas obrigatoriamente quando o manifest pede reprocessar=True
+_ETAPAS_POR_ESCOPO = {
+    "PDF": ("OCR",),
+    "OPENAI": ("IA1", "IA2"),
+    "FULL": ("OCR", "IA1", "IA2"),
+}
+
+
+def _ainda_dono(job_id: str) -> bool:
+    try:
+        verificar_lease(job_id)
+        return True
+    except LeasePerdido as e:
+        LOGGER.error(f"{e} Job não será movido para error por este nó.")
+        return False
+
+
+def _reaproveitar_etapa(job_id: str, etapa: str, fingerprint: str, politica: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Devolve a saída salva da etapa se o ledger indicar que a mesma entrada (fingerprint) já foi
+    processada com sucesso e o reprocess_scope não forçar a etapa; caso contrário None (executar).
+    """
+    if should_reprocess(politica, job_id, "JOB", fingerprint, etapa=etapa):
+        return None
+    return carregar_checkpoint(job_id, etapa, fingerprint)
+
+
+def _concluir_etapa(job_id: str, etapa: str, fingerprint: str, saida: Dict[str, Any]) -> None:
+    """Grava o checkpoint da etapa e registra a execução no ledger (hash_pdf=entrada, hash_md=saída)."""
+    salvar_checkpoint(job_id, etapa, fingerprint, saida)
+    register_entry(
+        job_id=job_id,
+        arquivo_id="JOB",
+        etapa=etapa,
+        hash_pdf=fingerprint,
+        hash_md=calcular_fingerprint(saida),
+        status="OK",
+    )
+
+
+def _executar_pipeline(job_id: str, processing_dir: Path, nova_execucao: bool = False):
+    """
+    Executa as etapas do job já em /processing. Cada etapa concluída grava um checkpoint
+    (outbox/<job_id>/checkpoints/) e uma entrada no ledger; etapas cuja entrada (fingerprint:
+    arquivos, prompt, modelo e saídas anteriores) não mudou são reaproveitadas.
+
+    O reprocess_scope do manifest só vale para a execução nova; ao retomar um job órfão,
+    as etapas já concluídas nesta execução são reaproveitadas normalmente.
+    """
     try:
         # 1) Carrega e valida manifest
         manifest: Dict[str, Any] = load_manifest(processing_dir, strict_files=True)
@@ -120,67 +251,277 @@ def process_job(inbox_job_dir: Path):
         if manifest.get("job_id") != job_id:
             LOGGER.warning(f"[{job_id}] job_id no manifest difere do nome da pasta. Prosseguindo assim mesmo.")
 
+        politica = manifest if nova_execucao else {**manifest, "reprocessar": False}
+        forcadas = _ETAPAS_POR_ESCOPO.get(manifest.get("reprocess_scope"), ()) if nova_execucao and manifest.get("reprocessar") else ()
+        if forcadas:
+            # Sem isso, uma retomada após crash reaproveitaria a saída da execução anterior
+            limpar_checkpoints(job_id, forcadas)
+        forcar_ocr = "OCR" in forcadas
+        verificar_lease(job_id)
+        fp_entrada = fingerprint_entrada_job(processing_dir)
+
+        # 1b) ReceitaWS/SERPRO – stage do manifest e consulta em paralelo ao OCR/IA1
+        # Sem checkpoint: a situação cadastral muda com o tempo e o consulta_serpro já tem cache com TTL
+        _stage_manifest_for_serpro(job_id, manifest)
+        LOGGER.info(f"[{job_id}] Consulta ReceitaWS disparada em segundo plano…")
+        serpro_future = consultar_cnpj_em_segundo_plano(manifest)
+
         # 2) OCR/Docling
-        LOGGER.info(f"[{job_id}] Iniciando OCR/Docling…")
-        ocr_result = executar_ocr(job_id, manifest)
+        fp_ocr = calcular_fingerprint(fp_entrada, "OCR")
+        ocr_result = _reaproveitar_etapa(job_id, "OCR", fp_ocr, politica)
+        if ocr_result is None:
+            LOGGER.info(f"[{job_id}] Iniciando OCR/Docling…")
+            ocr_result = executar_ocr(job_id, manifest, forcar=forcar_ocr)
+            # OCR com erro ou sem texto não vira checkpoint (senão seria reaproveitado no reenvio)
+            if ocr_result.get("status") == "OK" and ocr_result.get("dados_extraidos"):
+                _concluir_etapa(job_id, "OCR", fp_ocr, ocr_result)
         LOGGER.info(f"[{job_id}] OCR/Docling concluído: {ocr_result.get('status')}")
 
         # 3) IA Validador 1
-        LOGGER.info(f"[{job_id}] Iniciando IA Validador 1…")
-        ia1_result = validar_documentos_openai(job_id, ocr_result.get("dados_extraidos", ""), manifest, modo="padrao")
+        verificar_lease(job_id)
+        entrada_ia1 = ocr_result.get("dados_extraidos", "")
+        fp_ia1 = fingerprint_validacao(entrada_ia1, manifest, modo="padrao")
+        ia1_result = _reaproveitar_etapa(job_id, "IA1", fp_ia1, politica)
+        if ia1_result is None:
+            LOGGER.info(f"[{job_id}] Iniciando IA Validador 1…")
+            ia1_result = validar_documentos_openai(job_id, entrada_ia1, manifest, modo="padrao", usar_cache="IA1" not in forcadas)
+            if ia1_result.get("status") == "OK":
+                _concluir_etapa(job_id, "IA1", fp_ia1, ia1_result)
         LOGGER.info(f"[{job_id}] IA1 concluída: {ia1_result.get('status')}")
 
-        # 4) ReceitaWS/SERPRO – stage do manifest e consulta
-        LOGGER.info(f"[{job_id}] Consultando dados ReceitaWS…")
-        # antes de consultar o SERPRO:
-        _stage_manifest_for_serpro(job_id, manifest)
+        # 4) ReceitaWS/SERPRO – aguarda a consulta disparada no início do job
+        LOGGER.info(f"[{job_id}] Aguardando dados ReceitaWS…")
+        serpro_result = serpro_future.result()
+        LOGGER.info(f"[{job_id}] ReceitaWS concluída: {serpro_result.get('status')}")
 
-        serpro_result = consultar_cnpj(manifest)
+        verificar_lease(job_id)
 
-        LOGGER.info(f"[{job_id}] ReceitaWS concluída: {serpro_result.get('status')}")
+        # 4b) Regras determinísticas (DV de CNPJ/CPF, validade da CNH, situação e razão social na Receita)
+        fatos = avaliar_regras(manifest, ocr_result, serpro_result)
+        evid_fatos = salvar_fatos(job_id, fatos)
 
-        # 5) IA Validador 2 (comparativa)
-        LOGGER.info(f"[{job_id}] Iniciando IA Validador 2 (comparativa)…")
-        entrada_ia2 = {
-            "dados_ocr": ocr_result.get("dados_extraidos", ""),
-            "dados_serpro": serpro_result.get("dados", {}),
-            "resultado_ia1": ia1_result.get("resultado", {}),
-        }
-        ia2_result = validar_documentos_openai(job_id, json.dumps(entrada_ia2, ensure_ascii=False), manifest, modo="comparativo")
+        # 5) IA Validador 2 (comparativa) — dispensada se as regras já decidiram os critérios críticos
+        # Entrada enxuta: JSON técnico da IA1 + campos da ReceitaWS + texto só dos documentos INSUFICIENTES
+        entrada_ia2 = json.dumps(
+            montar_entrada_comparativa(manifest, ocr_result, serpro_result, ia1_result, fatos),
+            ensure_ascii=False,
+        )
+        fp_ia2 = fingerprint_validacao(entrada_ia2, manifest, modo="comparativo")
+        ia2_result = None
+        if dispensa_ia2(fatos):
+            ia2_result = resultado_por_regras(job_id, manifest, fatos, evid_fatos)
+        else:
+            ia2_result = _reaproveitar_etapa(job_id, "IA2", fp_ia2, politica)
+        if ia2_result is None:
+            LOGGER.info(f"[{job_id}] Iniciando IA Validador 2 (comparativa)…")
+            ia2_result = validar_documentos_openai(job_id, entrada_ia2, manifest, modo="comparativo", usar_cache="IA2" not in forcadas)
+            if ia2_result.get("status") == "OK":
+                _concluir_etapa(job_id, "IA2", fp_ia2, ia2_result)
         LOGGER.info(f"[{job_id}] IA2 concluída: {ia2_result.get('status')}")
 
         # 6) Relatórios finais
+        verificar_lease(job_id)
         LOGGER.info(f"[{job_id}] Gerando relatório final…")
         gerar_relatorio_final(job_id, manifest, ocr_result, ia1_result, serpro_result, ia2_result)
         LOGGER.info(f"[{job_id}] Relatório final gerado.")
 
         # 7) Done
+        verificar_lease(job_id)
         _move_processing_to_done(job_id)
         registrar_evento("WATCHER", "Pipeline concluído com sucesso", "INFO", job_id=job_id)
 
+    except LeasePerdido as e:
+        # Outro nó assumiu o job: não move nada (a pasta agora é dele)
+        LOGGER.error(f"{e} Pipeline interrompido neste nó.")
+        registrar_evento(job_id=job_id, etapa="WATCHER", mensagem="Pipeline interrompido: lease perdido", nivel="erro")
+
     except Exception as e:
         LOGGER.exception(f"[{job_id}] Erro durante o processamento do job: {e}")
+        if not _ainda_dono(job_id):
+            return
         _move_processing_to_error(job_id)
         registrar_evento(job_id=job_id, etapa="WATCHER", mensagem=f"Pipeline falhou: {e}", nivel="erro")
 
 
+# -----------------------------------------------------------------------------
+# Execução concorrente de jobs
+# -----------------------------------------------------------------------------
+def _get_executor() -> ThreadPoolExecutor:
+    """Cria (sob demanda) o pool de workers limitado por WATCHER_MAX_PARALLEL_JOBS."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_PARALLEL_JOBS, thread_name_prefix="job")
+        LOGGER.info(f"Pool de jobs inicializado com {MAX_PARALLEL_JOBS} worker(s).")
+    return _EXECUTOR
+
+def _liberar_job(job_id: str, future: Future) -> None:
+    """Callback de término: remove o job da lista de andamento e loga falhas não tratadas."""
+    with _JOBS_LOCK:
+        _JOBS_EM_ANDAMENTO.pop(job_id, None)
+    exc = future.exception()
+    if exc is not None:
+        LOGGER.error(f"[{job_id}] Worker terminou com exceção não tratada: {exc}")
+
+def _despachar_job(job_dir: Path, executar=None) -> bool:
+    """
+    Envia o job para o pool, a menos que já esteja em andamento.
+    Retorna True se o job foi despachado nesta chamada.
+    """
+    job_id = job_dir.name
+    executar = executar or process_job
+    with _JOBS_LOCK:
+        if job_id in _JOBS_EM_ANDAMENTO:
+            return False
+        future = _get_executor().submit(executar, job_dir)
+        _JOBS_EM_ANDAMENTO[job_id] = future
+    future.add_done_callback(lambda f, jid=job_id: _liberar_job(jid, f))
+    return True
+
+def _aguardar_jobs_em_andamento() -> None:
+    with _JOBS_LOCK:
+        pendentes = list(_JOBS_EM_ANDAMENTO.values())
+    if pendentes:
+        LOGGER.info(f"Aguardando {len(pendentes)} job(s) em andamento…")
+        wait(pendentes)
+
+# -----------------------------------------------------------------------------
+# Detecção por eventos (watchdog)
+# -----------------------------------------------------------------------------
+class _InboxEventHandler(FileSystemEventHandler):
+    """
+    Reage a criação, escrita, fechamento e renomeação de qualquer arquivo dentro de uma pasta de job
+    (a que contém manifest.json). Cada evento só enfileira a pasta: o loop principal faz o debounce
+    e despacha o job depois de WAIT_STABILITY_SECONDS sem novos eventos (nenhum processamento aqui).
+    """
+
+    def __init__(self, inbox_root: Path, fila: "queue.Queue[Path]"):
+        super().__init__()
+        self.inbox_root = inbox_root
+        self.fila = fila
+
+    def _localizar_job_dir(self, arquivo: Path) -> Optional[Path]:
+        """Sobe a partir do arquivo até achar a pasta com manifest.json (sem sair do inbox)."""
+        for pasta in [arquivo.parent, *arquivo.parent.parents]:
+            if pasta == self.inbox_root or self.inbox_root not in pasta.parents:
+                return None
+            if (pasta / "manifest.json").exists():
+                return pasta
+        return None
+
+    def _enfileirar(self, arquivo: Path) -> None:
+        job_dir = self._localizar_job_dir(arquivo)
+        if job_dir is not None:
+            LOGGER.debug(f"Evento de inbox para job {job_dir.name}: {arquivo.name}")
+            pre_buscar_cnpj_do_manifest(job_dir / "manifest.json")
+            self.fila.put(job_dir)
+
+    def _ao_alterar(self, event):
+        if not event.is_directory:
+            self._enfileirar(Path(os.fsdecode(event.src_path)))
+
+    on_created = on_modified = on_closed = _ao_alterar
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._enfileirar(Path(os.fsdecode(event.dest_path)))
+
 # -----------------------------------------------------------------------------
 # Loop principal
 # -----------------------------------------------------------------------------
-def detect_and_move_jobs(run_once: bool = False):
-    LOGGER.info("Iniciando monitoramento do diretório /inbox …")
-    while True:
-        jobs = list(_iter_inbox_job_dirs())
-        if jobs:
-            LOGGER.info(f"{len(jobs)} job(s) detectado(s) em /inbox.")
-            for job_dir in jobs:
-                process_job(job_dir)
-        else:
-            LOGGER.debug("Nenhum job novo detectado.")
+def recuperar_jobs_orfaos() -> int:
+    """
+    Passo de recuperação: jobs deixados em /processing (ex.: restart do container ou nó morto
+    com lease expirado) são retomados a partir do último checkpoint em vez de ficarem parados.
+    Executado no startup e a cada varredura de reconciliação.
+    """
+    orfaos = [
+        d for d in listar_jobs_orfaos()
+        if lease_disponivel(d.name) and _despachar_job(d, retomar_job)
+    ]
+    if orfaos:
+        LOGGER.warning(f"{len(orfaos)} job(s) órfão(s) em /processing retomado(s): {[d.name for d in orfaos]}")
+    return len(orfaos)
 
+def _varrer_inbox() -> None:
+    """Varredura completa do /inbox (modo polling ou reconciliação do modo eventos)."""
+    jobs = list(_iter_inbox_job_dirs())
+    if jobs:
+        # Aquece o cache da ReceitaWS já na detecção (mesmo com upload em andamento)
+        with _JOBS_LOCK:
+            em_andamento = set(_JOBS_EM_ANDAMENTO)
+        for job_dir in jobs:
+            if job_dir.name not in em_andamento:
+                pre_buscar_cnpj_do_manifest(job_dir / "manifest.json")
+        novos = [job_dir for job_dir in jobs if _upload_estavel(job_dir) and _despachar_job(job_dir)]
+        if novos:
+            with _JOBS_LOCK:
+                total = len(_JOBS_EM_ANDAMENTO)
+            LOGGER.info(f"{len(novos)} job(s) novo(s) despachado(s) de /inbox ({total} em andamento).")
+    else:
+        LOGGER.debug("Nenhum job novo detectado.")
+
+def _loop_polling(run_once: bool) -> None:
+    while True:
+        recuperar_jobs_orfaos()
+        _varrer_inbox()
         if run_once:
+            _aguardar_jobs_em_andamento()
             break
         time.sleep(SLEEP_INTERVAL)
 
+def _loop_eventos(run_once: bool) -> None:
+    inbox_root = Path(DIRS["INBOX_DIR"]).resolve()
+    fila: "queue.Queue[Path]" = queue.Queue()
+    observer = Observer()
+    observer.schedule(_InboxEventHandler(inbox_root, fila), str(inbox_root), recursive=True)
+    observer.start()
+    LOGGER.info(f"Detecção por eventos ativa em {inbox_root.as_posix()} (reconciliação a cada {RECONCILE_INTERVAL}s).")
+    try:
+        proxima_reconciliacao = 0.0
+        pendentes: Dict[Path, float] = {}  # debounce: job_dir → instante do último evento
+        while True:
+            if time.monotonic() >= proxima_reconciliacao:
+                recuperar_jobs_orfaos()
+                _varrer_inbox()
+                proxima_reconciliacao = time.monotonic() + RECONCILE_INTERVAL
+            if run_once:
+                _aguardar_jobs_em_andamento()
+                break
+            proximo = min([proxima_reconciliacao, *(t + WAIT_STABILITY_SECONDS for t in pendentes.values())])
+            try:
+                pendentes[fila.get(timeout=max(0.1, proximo - time.monotonic()))] = time.monotonic()
+            except queue.Empty:
+                pass
+            agora = time.monotonic()
+            for job_dir in [j for j, t in pendentes.items() if agora - t >= WAIT_STABILITY_SECONDS]:
+                del pendentes[job_dir]
+                if _upload_estavel(job_dir):
+                    if _despachar_job(job_dir):
+                        LOGGER.info(f"[{job_dir.name}] Job despachado a partir de evento do /inbox.")
+                elif (job_dir / "manifest.json").exists() and not _is_upload_in_progress(job_dir):
+                    pendentes[job_dir] = agora  # arquivo alterado há pouco: aguarda mais uma janela
+                # com *.part, o evento da renomeação final (ou a reconciliação) traz o job de volta
+    finally:
+        observer.stop()
+        observer.join()
+
+def detect_and_move_jobs(run_once: bool = False):
+    LOGGER.info("Iniciando monitoramento do diretório /inbox …")
+    if DOCLING_PRELOAD:
+        aquecer_docling()
+    usar_eventos = WATCHER_MODE == "eventos"
+    if usar_eventos and not WATCHDOG_AVAILABLE:
+        LOGGER.warning("watchdog não disponível — usando detecção por polling.")
+        usar_eventos = False
+    try:
+        if usar_eventos:
+            _loop_eventos(run_once)
+        else:
+            _loop_polling(run_once)
+    except KeyboardInterrupt:
+        LOGGER.warning("Interrupção recebida — finalizando jobs em andamento antes de sair.")
+        _aguardar_jobs_em_andamento()
+        raise
+
 if __name__ == "__main__":
     detect_and_move_jobs(run_once=False)